@@ -0,0 +1,110 @@
+"""Compares rebuilding the layout from scratch against the persistent BSP tree
+
+    python benchmarks/bench_bsp.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wmpy.bsp import BSPTree  # noqa: E402
+
+REGION = (12, 12, 1908, 1028)
+SPLIT_RATIO = 1.7
+
+
+class StubWindow(object):
+    def __init__(self, rect):
+        self.display_size = rect
+
+    @property
+    def display_area(self):
+        left, top, right, bottom = self.display_size
+        return (right - left) * (bottom - top)
+
+
+def check_overlap(a, b):
+    return not (a[0] >= b[2] or a[1] >= b[3] or a[2] <= b[0] or a[3] <= b[1])
+
+
+def overlap_area(a, b):
+    return min(a[2] - b[0], b[2] - a[0]) * min(a[3] - b[1], b[3] - a[1])
+
+
+def rebuild(area, windows, layout):
+    """The previous Tiler.__tile_area, re-sorting at every level"""
+    if len(windows) == 0:
+        return
+    if len(windows) == 1:
+        layout[windows[0]] = area
+        return
+    left, top, right, bottom = area
+    width = right - left
+    height = bottom - top
+    if width >= height * SPLIT_RATIO:
+        regions = [(left, top, left + width // 2, bottom),
+                   (left + width // 2, top, right, bottom)]
+    else:
+        regions = [(left, top, right, top + height // 2),
+                   (left, top + height // 2, right, bottom)]
+    by_region = [[], []]
+    for w in sorted(windows, key=lambda w: w.display_area, reverse=True):
+        if len(by_region[0]) == len(by_region[1]):
+            overlap = [overlap_area(w.display_size, r) if check_overlap(
+                w.display_size, r) else 0 for r in regions]
+            by_region[0 if overlap[0] >= overlap[1] else 1].append(w)
+        else:
+            by_region[0 if len(by_region[0]) < len(by_region[1]) else 1].append(w)
+    for i in range(2):
+        rebuild(regions[i], by_region[i], layout)
+
+
+def random_windows(count):
+    random.seed(count)
+    windows = []
+    for _ in range(count):
+        left = random.randint(0, 1500)
+        top = random.randint(0, 700)
+        windows.append(StubWindow((left, top, left + random.randint(200, 400),
+                                   top + random.randint(150, 300))))
+    return windows
+
+
+def bench(count, repeat=20):
+    windows = random_windows(count)
+    extra = StubWindow((100, 100, 500, 400))
+
+    def full_rebuild():
+        rebuild(REGION, windows + [extra], {})
+
+    tree = BSPTree()
+    tree.layout(REGION, SPLIT_RATIO)
+    for w in windows:
+        tree.insert(w, w.display_size)
+    tree.take_changed()
+
+    def incremental():
+        tree.insert(extra, extra.display_size)
+        tree.take_changed()
+        tree.remove(extra)
+        tree.take_changed()
+
+    old = min(timeit.repeat(full_rebuild, number=1, repeat=repeat))
+    # one insert and one remove per run, report half for a single change
+    new = min(timeit.repeat(incremental, number=1, repeat=repeat)) / 2
+    return old, new
+
+
+def main():
+    print('{0:>8} {1:>14} {2:>14} {3:>8}'.format(
+        'windows', 'rebuild (us)', 'bsp tree (us)', 'speedup'))
+    for count in (10, 100, 1000):
+        old, new = bench(count)
+        print('{0:>8} {1:>14.1f} {2:>14.1f} {3:>7.0f}x'.format(
+            count, old * 1e6, new * 1e6, old / new))
+
+
+if __name__ == '__main__':
+    main()
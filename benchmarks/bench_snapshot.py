@@ -0,0 +1,59 @@
+"""Compares Win32 calls of per-monitor enumeration against DesktopSnapshot
+
+    python benchmarks/bench_snapshot.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wmpy.backend as backend  # noqa: E402
+from wmpy.constants import GWL_STYLE  # noqa: E402
+from wmpy.monitor import Monitor  # noqa: E402
+from wmpy.simulated import SimulatedDesktop  # noqa: E402
+from wmpy.snapshot import DesktopSnapshot  # noqa: E402
+from wmpy.window import should_manage_style  # noqa: E402
+
+
+def per_monitor_scan(desktop, monitors):
+    """The previous get_windows_from_monitor, run once per monitor"""
+    results = {}
+    for monitor in monitors:
+        windows = []
+        for handle in desktop.enum_windows():
+            desktop.get_monitor_info(monitor.handle)
+            if (desktop.is_window_visible(handle) and not desktop.is_iconic(handle) and
+                    should_manage_style(desktop.get_window_long(handle, GWL_STYLE)) and
+                    desktop.monitor_from_window(handle) == monitor.handle):
+                windows.append(handle)
+        results[monitor] = set(windows)
+    return results
+
+
+def snapshot_scan(desktop, monitors):
+    snapshot = DesktopSnapshot.capture()
+    return {monitor: set(w.handle for w in snapshot.windows_for_monitor(monitor))
+            for monitor in monitors}
+
+
+def measure(desktop, func, monitors):
+    desktop.reset_calls()
+    result = func(desktop, monitors)
+    return result, desktop.total_calls()
+
+
+def main():
+    print('{0:>8} {1:>8} {2:>8} {3:>12} {4:>12}'.format(
+        'monitors', 'windows', 'hidden', 'per-monitor', 'snapshot'))
+    for monitors, windows, hidden in ((1, 10, 100), (2, 50, 200), (4, 100, 400)):
+        desktop = backend.use(SimulatedDesktop().populate(monitors, windows, hidden))
+        displays = Monitor.get_displays()
+        old, old_calls = measure(desktop, per_monitor_scan, displays)
+        new, new_calls = measure(desktop, snapshot_scan, displays)
+        assert old == new
+        print('{0:>8} {1:>8} {2:>8} {3:>12} {4:>12}'.format(
+            monitors, monitors * windows, monitors * hidden, old_calls, new_calls))
+
+
+if __name__ == '__main__':
+    main()
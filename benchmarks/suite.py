@@ -0,0 +1,342 @@
+"""Times wmpy's hot paths against the simulated desktop
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --json results.json
+    python benchmarks/suite.py --compare baseline.json
+
+Every scenario builds a fresh SimulatedDesktop and WindowManager, then times
+only the part under test. Backend call counts are deterministic, so any
+increase against a baseline is reported as a regression, wall time only when
+it grows by more than --tolerance. Scenarios that check the resulting layout
+report windows left out of their tiles as 'misplaced', any is a regression.
+"""
+import argparse
+import collections
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# config.json is read from the working directory
+os.chdir(ROOT)
+
+import wmpy.backend as backend  # noqa: E402
+from wmpy.cache import window_cache  # noqa: E402
+import wmpy.log as log  # noqa: E402
+from wmpy.manager import WindowManager  # noqa: E402
+from wmpy.metrics import PhaseTimer  # noqa: E402
+from wmpy.simulated import SimulatedDesktop  # noqa: E402
+import wmpy.config as config  # noqa: E402
+
+SCENARIOS = collections.OrderedDict()
+
+# 60 events per second, like a window dragged across the screen
+FRAME_MS = 16
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+class Probe(object):
+    """Records wall time and backend calls of the measured section"""
+
+    def __init__(self, desktop):
+        self.desktop = desktop
+        self.wall = 0.0
+        self.calls = collections.Counter()
+        self.extra = {}
+
+    @contextlib.contextmanager
+    def measure(self):
+        self.desktop.reset_calls()
+        start = time.perf_counter()
+        yield
+        self.wall = time.perf_counter() - start
+        self.calls = collections.Counter(self.desktop.calls)
+
+
+def manager_on(desktop):
+    """Returns a tiled WindowManager receiving the desktop's events"""
+    backend.use(desktop)
+    wm = WindowManager()
+    for tiler in wm.tilers:
+        tiler.tile_windows()
+    wm.init_events()
+    # delayed calls follow the simulated clock
+    wm.events.scheduler.clock = desktop.monotonic
+    desktop.attach(wm.hook_ranges, wm.handle_win_event, wm.handle_display_change)
+    return wm
+
+
+def moves(wm):
+    return sum(t.moves_issued for t in wm.tilers)
+
+
+def misplaced(wm, desktop):
+    """Returns the number of windows not where their tile wants them or not owned by one tiler"""
+    count = 0
+    owners = collections.Counter()
+    for t in wm.tilers:
+        for w in t.windows:
+            owners[int(w.handle)] += 1
+            if wm.registry.tiler_of(w.handle) is not t:
+                count += 1
+            elif not w.is_floating() and desktop.windows[w.handle].rect != t.applied.get(w):
+                count += 1
+    # listed by several tilers or by none
+    count += sum(n - 1 for n in owners.values())
+    count += sum(1 for hwnd in wm.registry.windows if hwnd not in owners)
+    return count
+
+
+@scenario('retile_1x50')
+def retile_1x50(latency):
+    """Tray refresh on 1 monitor with 50 windows: resync and full relayout"""
+    desktop = SimulatedDesktop(latency).populate(1, 50, 50)
+    wm = manager_on(desktop)
+    probe = Probe(desktop)
+    with probe.measure():
+        wm.resync()
+        for tiler in wm.tilers:
+            tiler.tile_windows(relayout=True)
+    return probe
+
+
+@scenario('startup_4x200')
+def startup_4x200(latency):
+    """Startup on 4 monitors with 200 windows (and 200 hidden ones)"""
+    desktop = SimulatedDesktop(latency).populate(4, 50, 50)
+    backend.use(desktop)
+    probe = Probe(desktop)
+    with probe.measure():
+        wm = WindowManager()
+        wm.tile_all()
+    probe.extra['moves'] = moves(wm)
+    return probe
+
+
+@scenario('startup_4x100')
+def startup_4x100(latency):
+    """Startup up to the first tile and hooked events, 4 monitors with 100 windows"""
+    desktop = SimulatedDesktop(latency).populate(4, 25, 25)
+    backend.use(desktop)
+    probe = Probe(desktop)
+    with probe.measure():
+        startup = PhaseTimer()
+        wm = WindowManager(startup=startup)
+        wm.tile_all()
+        startup.mark('first tile')
+        wm.init_events()
+        startup.mark('events')
+    probe.extra['moves'] = moves(wm)
+    probe.extra['startup_ms'] = startup.summary()
+    return probe
+
+
+@scenario('refresh_4x200')
+def refresh_4x200(latency):
+    """Relayout of 4 monitors with 200 windows whose apps take 0.2 ms per move"""
+    desktop = SimulatedDesktop(latency).populate(4, 50)
+    wm = manager_on(desktop)
+    desktop.answer_time = 0.0002
+    # every window lands somewhere new
+    saved = config.data
+    config.data = dict(saved, DisplayPadding=[8, 8, -8, -8])
+    before = moves(wm)
+    probe = Probe(desktop)
+    try:
+        with probe.measure():
+            wm.tile_all(relayout=True)
+    finally:
+        config.data = saved
+    probe.extra['moves'] = moves(wm) - before
+    probe.extra['placement_ms'] = [t.placement_ms for t in wm.tilers]
+    return probe
+
+
+@scenario('hung_late_batch')
+def hung_late_batch(latency):
+    """A batch stuck on a hung app lands after a later retile moved its windows"""
+    desktop = SimulatedDesktop(latency).populate(1, 5)
+    wm = manager_on(desktop)
+    desktop.hang_time = 0.4
+    hung = next(iter(desktop.windows))
+    desktop.hang(hung)
+    saved = config.data
+    probe = Probe(desktop)
+    try:
+        with probe.measure():
+            config.data = dict(saved, DisplayPadding=[8, 8, -8, -8])
+            # times out, the batch keeps running
+            wm.tile_all(relayout=True)
+            config.data = dict(saved, DisplayPadding=[16, 16, -16, -16])
+            wm.tile_all(relayout=True)
+            # the stuck batch lands with the first padding
+            time.sleep(desktop.hang_time)
+            desktop.hang(hung, False)
+            wm.retry_hung()
+            probe.extra['misplaced'] = misplaced(wm, desktop)
+    finally:
+        config.data = saved
+    return probe
+
+
+@scenario('monitor_hotplug')
+def monitor_hotplug(latency):
+    """A second monitor plugged in, Windows moves 3 of 10 windows onto it"""
+    desktop = SimulatedDesktop(latency).populate(1, 10)
+    wm = manager_on(desktop)
+    desktop.add_monitor((1920, 0, 3840, 1080))
+    for hwnd in list(desktop.windows)[:3]:
+        left, top, right, bottom = desktop.windows[hwnd].rect
+        desktop.windows[hwnd].rect = (left + 1920, top, right + 1920, bottom)
+    probe = Probe(desktop)
+    with probe.measure():
+        wm.on_display_change()
+    probe.extra['misplaced'] = misplaced(wm, desktop)
+    probe.extra['windows'] = [len(t.windows) for t in wm.tilers]
+    return probe
+
+
+@scenario('drag_storm_30s')
+def drag_storm_30s(latency):
+    """A window dragged back and forth over 19 others for 30 seconds"""
+    desktop = SimulatedDesktop(latency).populate(1, 20)
+    wm = manager_on(desktop)
+    hwnd = next(iter(desktop.windows))
+    left, top, right, bottom = desktop.windows[hwnd].rect
+    width = right - left
+    span = 1920 - width
+    before = moves(wm)
+    probe = Probe(desktop)
+    with probe.measure():
+        for frame in range(30 * 1000 // FRAME_MS):
+            # ping-pong across the monitor every 4 seconds
+            x = abs((frame * 8) % (2 * span) - span)
+            desktop.advance(FRAME_MS)
+            desktop.move_window_by_user(hwnd, (x, top, x + width, bottom))
+            wm.events.dispatch_pending()
+    probe.extra['moves'] = moves(wm) - before
+    probe.extra['events'] = wm.events.stats()
+    return probe
+
+
+@scenario('popups_40')
+def popups_40(latency):
+    """A browser opening 40 popup windows next to 10 existing ones"""
+    desktop = SimulatedDesktop(latency).populate(1, 10)
+    wm = manager_on(desktop)
+    before = moves(wm)
+    probe = Probe(desktop)
+    with probe.measure():
+        for i in range(40):
+            offset = 20 * i
+            desktop.create_window((200 + offset, 100 + offset, 800 + offset, 600 + offset),
+                                  title='popup {0}'.format(i),
+                                  classname='Chrome_WidgetWin_1')
+            desktop.advance(FRAME_MS)
+            wm.events.dispatch_pending()
+    probe.extra['moves'] = moves(wm) - before
+    probe.extra['events'] = wm.events.stats()
+    return probe
+
+
+def run(name, repeat, latency):
+    """Runs a scenario repeat times, keeping the fastest wall time"""
+    best = None
+    for _ in range(repeat):
+        # every simulated desktop hands out the same hwnds
+        window_cache.clear()
+        probe = SCENARIOS[name](latency)
+        if best is None or probe.wall < best.wall:
+            best = probe
+    return {
+        "wall_ms": best.wall * 1000,
+        "calls": sum(best.calls.values()),
+        "calls_by_name": dict(sorted(best.calls.items())),
+        "extra": best.extra
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns a message for every scenario that got slower than baseline or misplaced windows"""
+    regressions = []
+    for name, result in results.items():
+        if result['extra'].get('misplaced'):
+            regressions.append('{0}: {1} windows left out of their tiles'.format(
+                name, result['extra']['misplaced']))
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if result['calls'] > old['calls']:
+            regressions.append('{0}: {1} backend calls, was {2}'.format(
+                name, result['calls'], old['calls']))
+        if result['wall_ms'] > old['wall_ms'] * (1 + tolerance):
+            regressions.append('{0}: {1:.1f} ms, was {2:.1f} ms'.format(
+                name, result['wall_ms'], old['wall_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenarios', nargs='*',
+                        help='scenarios to run, all by default: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds added to every backend call')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write results as JSON, - for stdout')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='exit with 1 if slower than a previous --json run')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative wall time increase')
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario ' + name)
+
+    # warnings, e.g. of the hung window scenario, would drown the report
+    log.setup(console=False)
+    results = collections.OrderedDict()
+    for name in args.scenarios or SCENARIOS:
+        results[name] = run(name, args.repeat, args.latency)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "latency": args.latency,
+        "scenarios": results
+    }
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=4)
+        print()
+    else:
+        print('{0:<16} {1:>10} {2:>8}'.format('scenario', 'wall (ms)', 'calls'))
+        for name, result in results.items():
+            print('{0:<16} {1:>10.2f} {2:>8}'.format(
+                name, result['wall_ms'], result['calls']))
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=4)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['scenarios']
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print('regression: ' + message, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
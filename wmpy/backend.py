@@ -0,0 +1,121 @@
+"""Contains the Backend interface wmpy uses to talk to the desktop
+
+Everything in wmpy reaches windows and monitors through get(), so the same
+Tiler and WindowManager run against the real Win32 desktop
+(wmpy.win32backend) or an in-memory one (wmpy.simulated).
+"""
+
+current = None
+
+
+class BackendError(Exception):
+    """Raised when a window or monitor operation fails, e.g. a destroyed hwnd"""
+
+
+class Backend(object):
+    """Window enumeration, queries, moves, monitor info and event delivery
+
+    Rects are (left, top, right, bottom) tuples in screen coordinates.
+    """
+
+    # windows
+
+    def enum_windows(self):
+        """Returns the handles of all top-level windows in z-order"""
+        raise NotImplementedError
+
+    def is_window(self, hwnd):
+        raise NotImplementedError
+
+    def is_window_visible(self, hwnd):
+        raise NotImplementedError
+
+    def is_iconic(self, hwnd):
+        raise NotImplementedError
+
+    def get_window_rect(self, hwnd):
+        raise NotImplementedError
+
+    def get_window_text(self, hwnd):
+        raise NotImplementedError
+
+    def get_class_name(self, hwnd):
+        raise NotImplementedError
+
+    def get_window_long(self, hwnd, index):
+        raise NotImplementedError
+
+    def set_window_long(self, hwnd, index, value):
+        raise NotImplementedError
+
+    def move_window(self, hwnd, rect):
+        """Moves and repaints a single window"""
+        raise NotImplementedError
+
+    def set_window_pos(self, hwnd, insert_after, rect, flags):
+        """SetWindowPos, rect may be None with SWP_NOMOVE | SWP_NOSIZE"""
+        raise NotImplementedError
+
+    def apply_window_positions(self, entries):
+        """Applies [(hwnd, insert_after, rect, flags)] as one batch
+
+        Returns True if the whole batch was applied, False if nothing was
+        and the caller should fall back to set_window_pos.
+        """
+        raise NotImplementedError
+
+    def is_hung(self, hwnd):
+        """Returns True if the window's app stopped answering messages"""
+        raise NotImplementedError
+
+    def release_mouse_button(self):
+        """Simulates releasing the left mouse button, ending a drag"""
+        raise NotImplementedError
+
+    # monitors
+
+    def enum_monitors(self):
+        """Returns the handles of all display monitors"""
+        raise NotImplementedError
+
+    def get_monitor_info(self, handle):
+        """Returns {"Monitor": rect, "Work": rect, "Flags": int}"""
+        raise NotImplementedError
+
+    def monitor_from_window(self, hwnd):
+        """Returns the handle of the monitor nearest to the window"""
+        raise NotImplementedError
+
+    # events
+
+    def tick_count(self):
+        """Returns milliseconds in the same clock as event timestamps"""
+        raise NotImplementedError
+
+    def run_message_loop(self, hook_ranges, on_event, on_display_change):
+        """Delivers events until quit_message_loop is called
+
+        on_event(event, hwnd, id_object, id_child, dwmsEventTime) is called
+        for every event in hook_ranges, on_display_change() whenever the
+        monitor layout or a work area changes. Blocks the calling thread.
+        """
+        raise NotImplementedError
+
+    def quit_message_loop(self, thread_id):
+        """Stops run_message_loop running on the given thread"""
+        raise NotImplementedError
+
+
+def use(backend):
+    """Makes backend the one used by all of wmpy"""
+    global current
+    current = backend
+    return backend
+
+
+def get():
+    """Returns the active backend, the Win32 one unless another was chosen"""
+    if current is None:
+        from wmpy.win32backend import Win32Backend
+        use(Win32Backend())
+    return current
@@ -0,0 +1,194 @@
+"""Contains the BSPTree class holding the tiled layout of a monitor"""
+
+
+def split_region(region, split_ratio):
+    """Splits a region in half, side by side if it is wide enough"""
+    left, top, right, bottom = region
+    width = right - left
+    height = bottom - top
+    if width >= height * split_ratio:
+        middle = left + width // 2
+        return (left, top, middle, bottom), (middle, top, right, bottom)
+    middle = top + height // 2
+    return (left, top, right, middle), (left, middle, right, bottom)
+
+
+def contains_point(region, point):
+    return region[0] <= point[0] < region[2] and region[1] <= point[1] < region[3]
+
+
+def center(rect):
+    return ((rect[0] + rect[2]) // 2, (rect[1] + rect[3]) // 2)
+
+
+class Node(object):
+    """A node of the BSP tree, leaves hold a single window"""
+
+    def __init__(self, window=None):
+        self.window = window
+        self.parent = None
+        self.children = None
+        self.region = None
+        # number of leaves under this node, keeps the tree balanced
+        self.leaves = 1
+
+    def is_leaf(self):
+        return self.children is None
+
+    def sibling(self):
+        a, b = self.parent.children
+        return b if a is self else a
+
+
+class BSPTree(object):
+    """Balanced binary space partition of a region, one leaf per window
+
+    Adding a window splits one leaf, removing a window merges its sibling
+    into the parent and swapping exchanges two leaves, so each change only
+    recomputes the regions of the subtree it touched. Leaves whose region
+    was recomputed are collected until take_changed() is called.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.nodes = {}
+        self.region = None
+        self.split_ratio = None
+        self.changed = {}
+
+    def __contains__(self, window):
+        return window in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def layout(self, region, split_ratio, force=False):
+        """Sets the area to tile, recomputing every region if it changed"""
+        if not force and region == self.region and split_ratio == self.split_ratio:
+            return
+        self.region = region
+        self.split_ratio = split_ratio
+        self.__place(self.root, region)
+
+    def take_changed(self):
+        """Returns and clears window: region for leaves that were recomputed"""
+        changed, self.changed = self.changed, {}
+        return changed
+
+    def regions(self):
+        return {window: node.region for window, node in self.nodes.items()}
+
+    def region_of(self, window):
+        return self.nodes[window].region
+
+    def window_at(self, point):
+        """Returns the window whose region contains point, or None"""
+        node = self.root
+        while node is not None and not node.is_leaf():
+            node = next((c for c in node.children
+                         if c.region is not None and contains_point(c.region, point)), None)
+        return node.window if node is not None else None
+
+    def insert(self, window, hint=None):
+        """Adds a window by splitting the leaf of the smaller subtree
+
+        When both subtrees are equally full the one containing the center
+        of hint (usually the window's current rect) is preferred, so windows
+        stay close to where they already are.
+        """
+        leaf = Node(window)
+        self.nodes[window] = leaf
+        if self.root is None:
+            self.root = leaf
+            self.__place(leaf, self.region)
+            return
+        self.__attach(leaf, self.root, hint)
+
+    def remove(self, window):
+        leaf = self.nodes.pop(window)
+        self.changed.pop(window, None)
+        parent = self.__detach(leaf)
+        self.__rebalance(parent)
+
+    def swap(self, a, b):
+        node_a = self.nodes[a]
+        node_b = self.nodes[b]
+        node_a.window, node_b.window = b, a
+        self.nodes[a], self.nodes[b] = node_b, node_a
+        self.changed[a] = node_b.region
+        self.changed[b] = node_a.region
+
+    def __attach(self, leaf, node, hint):
+        point = center(hint) if hint is not None else None
+        while not node.is_leaf():
+            a, b = node.children
+            if a.leaves != b.leaves:
+                node = a if a.leaves < b.leaves else b
+            elif point is not None and a.region is not None and contains_point(a.region, point):
+                node = a
+            else:
+                node = b
+
+        # the leaf becomes an inner node holding its old window and the new one
+        existing = Node(node.window)
+        self.nodes[existing.window] = existing
+        node.window = None
+        first_half = (point is not None and node.region is not None and
+                      contains_point(split_region(node.region, self.split_ratio)[0], point))
+        node.children = [leaf, existing] if first_half else [existing, leaf]
+        existing.parent = node
+        leaf.parent = node
+
+        while node is not None:
+            node.leaves += 1
+            node = node.parent
+        self.__place(existing.parent, existing.parent.region)
+
+    def __detach(self, leaf):
+        """Removes a leaf, its sibling takes over the parent's region"""
+        parent = leaf.parent
+        if parent is None:
+            self.root = None
+            return None
+        sibling = leaf.sibling()
+        grandparent = parent.parent
+        sibling.parent = grandparent
+        if grandparent is None:
+            self.root = sibling
+        else:
+            index = grandparent.children.index(parent)
+            grandparent.children[index] = sibling
+        node = grandparent
+        while node is not None:
+            node.leaves -= 1
+            node = node.parent
+        self.__place(sibling, parent.region)
+        return grandparent
+
+    def __rebalance(self, node):
+        """Moves a leaf from the fuller to the emptier side where needed"""
+        while node is not None:
+            a, b = node.children
+            if abs(a.leaves - b.leaves) > 1:
+                heavy, light = (a, b) if a.leaves > b.leaves else (b, a)
+                leaf = heavy
+                while not leaf.is_leaf():
+                    x, y = leaf.children
+                    leaf = x if x.leaves >= y.leaves else y
+                window = leaf.window
+                self.__detach(leaf)
+                moved = Node(window)
+                self.nodes[window] = moved
+                self.__attach(moved, light, None)
+            node = node.parent
+
+    def __place(self, node, region):
+        if node is None or region is None:
+            return
+        node.region = region
+        if node.is_leaf():
+            self.changed[node.window] = region
+            return
+        a, b = split_region(region, self.split_ratio)
+        self.__place(node.children[0], a)
+        self.__place(node.children[1], b)
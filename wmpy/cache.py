@@ -0,0 +1,135 @@
+"""Contains the WindowPropertyCache class for memoizing window queries"""
+import threading
+
+from wmpy.constants import EVENT_OBJECT_DESTROY
+from wmpy.constants import EVENT_OBJECT_SHOW
+from wmpy.constants import EVENT_OBJECT_HIDE
+from wmpy.constants import EVENT_OBJECT_STATECHANGE
+from wmpy.constants import EVENT_OBJECT_LOCATIONCHANGE
+from wmpy.constants import EVENT_OBJECT_NAMECHANGE
+from wmpy.constants import EVENT_SYSTEM_MINIMIZESTART
+from wmpy.constants import EVENT_SYSTEM_MINIMIZEEND
+
+ALL_PROPERTIES = None
+
+# event -> properties it makes stale, None drops the whole entry
+INVALIDATED_BY = {
+    EVENT_OBJECT_DESTROY: ALL_PROPERTIES,
+    EVENT_OBJECT_SHOW: ('visible',),
+    EVENT_OBJECT_HIDE: ('visible',),
+    EVENT_OBJECT_STATECHANGE: ('style', 'exstyle', 'visible', 'iconic'),
+    EVENT_OBJECT_LOCATIONCHANGE: ('rect',),
+    EVENT_OBJECT_NAMECHANGE: ('title',),
+    EVENT_SYSTEM_MINIMIZESTART: ('rect', 'style', 'iconic'),
+    EVENT_SYSTEM_MINIMIZEEND: ('rect', 'style', 'iconic'),
+}
+
+
+class WindowPropertyCache(object):
+    """Per-hwnd cache of rect, classname, title, styles and visibility
+
+    Values are loaded on first access (or filled from a DesktopSnapshot) and
+    kept until an event for that window says they changed. Invalidation runs
+    on the hook thread while loads run on the event worker, so each hwnd has
+    a generation and a load is only stored if no invalidation raced it.
+    Generations only grow, taken from one counter for all hwnds.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.generations = {}
+        self.clock = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, hwnd, name, loader):
+        entry = self.entries.get(hwnd)
+        if entry is not None and name in entry:
+            self.hits += 1
+            return entry[name]
+        self.misses += 1
+        generation = self.generations.get(hwnd, 0)
+        value = loader()
+        with self.lock:
+            if self.generations.get(hwnd, 0) == generation:
+                self.entries.setdefault(hwnd, {})[name] = value
+        return value
+
+    def forget(self, hwnd, names=ALL_PROPERTIES):
+        """Drops the given properties, or the whole entry, for a window"""
+        with self.lock:
+            self.clock += 1
+            self.generations[hwnd] = self.clock
+            self.invalidations += 1
+            if names is ALL_PROPERTIES:
+                self.entries.pop(hwnd, None)
+                return
+            entry = self.entries.get(hwnd)
+            if entry is not None:
+                for name in names:
+                    entry.pop(name, None)
+
+    def invalidate(self, event, hwnd):
+        """Drops whatever the event made stale"""
+        if event in INVALIDATED_BY:
+            self.forget(hwnd, INVALIDATED_BY[event])
+
+    def clear(self):
+        """Forgets every window, e.g. for a different desktop reusing the same hwnds"""
+        with self.lock:
+            self.entries = {}
+            self.clock += 1
+            for hwnd in self.generations:
+                self.generations[hwnd] = self.clock
+
+    def generation(self):
+        """Returns the mark to pass to fill(), taken before querying any window"""
+        with self.lock:
+            return self.clock
+
+    def fill(self, snapshot, since=None):
+        """Merges the properties recorded in a snapshot into the cache
+
+        Windows invalidated after since, a generation() from before the
+        snapshot was taken, keep what they have as the snapshot may be older.
+        Windows the snapshot did not see are dropped.
+        """
+        with self.lock:
+            seen = set()
+            self.clock += 1
+            for info in snapshot.windows:
+                seen.add(info.handle)
+                if since is not None and self.generations.get(info.handle, 0) > since:
+                    continue
+                entry = self.entries.setdefault(info.handle, {})
+                entry['visible'] = info.visible
+                if info.visible:
+                    entry['iconic'] = info.iconic
+                else:
+                    entry.pop('iconic', None)
+                if info.rect is not None:
+                    entry['rect'] = info.rect
+                    entry['style'] = info.style
+                    if info.exstyle is not None:
+                        entry['exstyle'] = info.exstyle
+                # loads started before this must not overwrite it
+                self.generations[info.handle] = self.clock
+            for hwnd in [h for h in self.entries if h not in seen]:
+                del self.entries[hwnd]
+            for hwnd in [h for h in self.generations if h not in seen]:
+                del self.generations[hwnd]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+window_cache = WindowPropertyCache()
@@ -1,21 +1,54 @@
 """Configuration file"""
 import json
 import os
-import re
+
+from wmpy.rules import RuleSet
 
 CONFIG_FILE = 'config.json'
 
+# read by ensure_loaded() at startup rather than on import
 data = None
+rules = None
+
+
+def config_path():
+    return os.path.join(os.getcwd(), CONFIG_FILE)
+
+
+def parse_config(path=None):
+    """Reads and compiles a config file without making it the current one"""
+    with open(path or config_path(), 'r') as f:
+        new_data = json.loads(f.read())
+    return new_data, RuleSet(new_data)
+
+
+def use_config(new_data, new_rules):
+    global data, rules
+    data, rules = new_data, new_rules
 
 
 def load_config():
-    global data
-    path = os.path.join(os.getcwd(), CONFIG_FILE)
-    with open(path, 'r') as f:
-        data = json.loads(f.read())
+    use_config(*parse_config())
 
 
-load_config()
+def ensure_loaded():
+    """Loads config.json unless a config is already current"""
+    if data is None:
+        load_config()
+
+
+def changed_settings(old, new):
+    """Returns the top-level keys whose values differ between two configs"""
+    return {key for key in set(old) | set(new) if old.get(key) != new.get(key)}
+
+
+def changed_entries(old, new, key):
+    """Returns the classnames (or titles) whose entry under key differs"""
+    a = old.get(key) or {}
+    b = new.get(key) or {}
+    if isinstance(a, list) or isinstance(b, list):
+        return set(a) ^ set(b)
+    return {name for name in set(a) | set(b) if a.get(name) != b.get(name)}
 
 
 def DISPLAY_PADDING():
@@ -46,19 +79,60 @@ def DISPLAY_MOVE_TIMEOUT():
     return data["DisplayMoveTimeout"]
 
 
-def IGNORED_CLASSNAMES():
-    return data["IgnoredClassNames"]
+def RESYNC_INTERVAL():
+    return data.get("ResyncInterval", 30)
+
+
+def CONFIG_RELOAD_INTERVAL():
+    # seconds between checks of config.json for changes, 0 disables
+    return data.get("ConfigReloadInterval", 2)
+
+
+def METRICS():
+    # collect handler latencies and backend call counts, see wmpy.metrics
+    return bool(data.get("Metrics", False))
+
+
+def TRACE_FILE():
+    # record hooked events to this file, see wmpy.trace
+    return data.get("TraceFile") or None
+
+
+def HUNG_WINDOW_TIMEOUT():
+    # ms to wait for a window's app before treating it as hung, see wmpy.guard
+    return data.get("HungWindowTimeout", 250)
+
+
+def HUNG_RETRY_INTERVAL():
+    # seconds between retries of moves hung windows missed
+    return data.get("HungRetryInterval", 5)
+
+
+def JOURNAL_FILE():
+    # keep the layout here to restore after a crash, see wmpy.journal
+    return data.get("JournalFile") or None
+
+
+def JOURNAL_INTERVAL():
+    # seconds between writes of layout changes to the journal
+    return data.get("JournalInterval", 1)
+
+
+def LOG_LEVEL():
+    # DEBUG, INFO, WARNING or ERROR, see wmpy.log
+    return str(data.get("LogLevel", "WARNING")).upper()
 
 
-def IGNORED_WINDOW_TITLES():
-    return data["IgnoredWindowTitles"]
+def LOG_FILE():
+    # also write the log to this file
+    return data.get("LogFile") or None
 
 
-def SPECIAL_MARGINS():
-    return data["SpecialMargins"]
+def LOG_BUFFER_SIZE():
+    # recent log records kept in memory for Dump Stats
+    return data.get("LogBufferSize", 1000)
 
 
-def GET_RULES(classname):
-    if classname in data["Rules"]:
-        return data["Rules"][classname]
-    return None
+def RULES():
+    """Returns the compiled RuleSet of the loaded config"""
+    return rules
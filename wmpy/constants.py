@@ -0,0 +1,120 @@
+"""Win32 constants used by wmpy, mirrored from win32con
+
+Kept in wmpy so that only the win32 backend needs pywin32 installed.
+"""
+
+GWL_STYLE = -16
+GWL_EXSTYLE = -20
+GW_OWNER = 4
+
+HWND_TOP = 0
+HWND_BOTTOM = 1
+HWND_TOPMOST = -1
+HWND_NOTOPMOST = -2
+
+MONITOR_DEFAULTTONULL = 0
+MONITOR_DEFAULTTOPRIMARY = 1
+MONITOR_DEFAULTTONEAREST = 2
+MONITORINFOF_PRIMARY = 1
+
+WM_CLOSE = 0x0010
+WM_QUIT = 0x0012
+WM_SETTINGCHANGE = 0x001A
+WM_DISPLAYCHANGE = 0x007E
+SPI_SETWORKAREA = 0x002F
+
+MOUSEEVENTF_LEFTUP = 0x0004
+MOUSEEVENTF_ABSOLUTE = 0x8000
+
+WINEVENT_OUTOFCONTEXT = 0
+OBJID_WINDOW = 0
+CHILDID_SELF = 0
+
+EVENT_MIN = 0x00000001
+EVENT_MAX = 0x7FFFFFFF
+EVENT_SYSTEM_FOREGROUND = 0x0003
+EVENT_SYSTEM_MOVESIZESTART = 0x000A
+EVENT_SYSTEM_MOVESIZEEND = 0x000B
+EVENT_SYSTEM_DRAGDROPSTART = 0x000E
+EVENT_SYSTEM_DRAGDROPEND = 0x000F
+EVENT_SYSTEM_MINIMIZESTART = 0x0016
+EVENT_SYSTEM_MINIMIZEEND = 0x0017
+EVENT_OBJECT_CREATE = 0x8000
+EVENT_OBJECT_DESTROY = 0x8001
+EVENT_OBJECT_SHOW = 0x8002
+EVENT_OBJECT_HIDE = 0x8003
+EVENT_OBJECT_REORDER = 0x8004
+EVENT_OBJECT_FOCUS = 0x8005
+EVENT_OBJECT_STATECHANGE = 0x800A
+EVENT_OBJECT_LOCATIONCHANGE = 0x800B
+EVENT_OBJECT_NAMECHANGE = 0x800C
+
+SWP_NOSIZE = 0x0001
+SWP_NOMOVE = 0x0002
+SWP_NOZORDER = 0x0004
+SWP_NOREDRAW = 0x0008
+SWP_NOACTIVATE = 0x0010
+SWP_FRAMECHANGED = 0x0020
+SWP_SHOWWINDOW = 0x0040
+SWP_HIDEWINDOW = 0x0080
+SWP_NOCOPYBITS = 0x0100
+SWP_NOOWNERZORDER = 0x0200
+SWP_NOSENDCHANGING = 0x0400
+SWP_DEFERERASE = 0x2000
+SWP_ASYNCWINDOWPOS = 0x4000
+
+WS_OVERLAPPED = 0x00000000
+WS_POPUP = 0x80000000
+WS_CHILD = 0x40000000
+WS_MINIMIZE = 0x20000000
+WS_VISIBLE = 0x10000000
+WS_DISABLED = 0x08000000
+WS_CLIPSIBLINGS = 0x04000000
+WS_CLIPCHILDREN = 0x02000000
+WS_MAXIMIZE = 0x01000000
+WS_CAPTION = 0x00C00000
+WS_BORDER = 0x00800000
+WS_DLGFRAME = 0x00400000
+WS_VSCROLL = 0x00200000
+WS_HSCROLL = 0x00100000
+WS_SYSMENU = 0x00080000
+WS_THICKFRAME = 0x00040000
+WS_GROUP = 0x00020000
+WS_TABSTOP = 0x00010000
+WS_MINIMIZEBOX = 0x00020000
+WS_MAXIMIZEBOX = 0x00010000
+WS_TILED = WS_OVERLAPPED
+WS_ICONIC = WS_MINIMIZE
+WS_SIZEBOX = WS_THICKFRAME
+WS_CHILDWINDOW = WS_CHILD
+WS_OVERLAPPEDWINDOW = (WS_OVERLAPPED | WS_CAPTION | WS_SYSMENU |
+                       WS_THICKFRAME | WS_MINIMIZEBOX | WS_MAXIMIZEBOX)
+WS_TILEDWINDOW = WS_OVERLAPPEDWINDOW
+WS_POPUPWINDOW = WS_POPUP | WS_BORDER | WS_SYSMENU
+
+WS_EX_DLGMODALFRAME = 0x00000001
+WS_EX_NOPARENTNOTIFY = 0x00000004
+WS_EX_TOPMOST = 0x00000008
+WS_EX_ACCEPTFILES = 0x00000010
+WS_EX_TRANSPARENT = 0x00000020
+WS_EX_MDICHILD = 0x00000040
+WS_EX_TOOLWINDOW = 0x00000080
+WS_EX_WINDOWEDGE = 0x00000100
+WS_EX_CLIENTEDGE = 0x00000200
+WS_EX_CONTEXTHELP = 0x00000400
+WS_EX_RIGHT = 0x00001000
+WS_EX_LEFT = 0x00000000
+WS_EX_RTLREADING = 0x00002000
+WS_EX_LTRREADING = 0x00000000
+WS_EX_LEFTSCROLLBAR = 0x00004000
+WS_EX_RIGHTSCROLLBAR = 0x00000000
+WS_EX_CONTROLPARENT = 0x00010000
+WS_EX_STATICEDGE = 0x00020000
+WS_EX_APPWINDOW = 0x00040000
+WS_EX_LAYERED = 0x00080000
+WS_EX_NOINHERITLAYOUT = 0x00100000
+WS_EX_LAYOUTRTL = 0x00400000
+WS_EX_COMPOSITED = 0x02000000
+WS_EX_NOACTIVATE = 0x08000000
+WS_EX_OVERLAPPEDWINDOW = WS_EX_WINDOWEDGE | WS_EX_CLIENTEDGE
+WS_EX_PALETTEWINDOW = WS_EX_WINDOWEDGE | WS_EX_TOOLWINDOW | WS_EX_TOPMOST
@@ -0,0 +1,262 @@
+"""Contains the EventQueue class for buffering hooked window events"""
+import collections
+import concurrent.futures
+import threading
+import time
+
+from wmpy.constants import CHILDID_SELF
+from wmpy.constants import OBJID_WINDOW
+
+import wmpy.constants as constants
+from wmpy.log import get_logger
+from wmpy.scheduler import Scheduler
+
+log = get_logger(__name__)
+
+EVENT_NAMES = {value: name for name, value in vars(constants).items()
+               if name.startswith('EVENT_') and name not in ('EVENT_MIN', 'EVENT_MAX')}
+
+
+def event_name(event):
+    return EVENT_NAMES.get(event, hex(event))
+
+
+def plan_hook_ranges(events, max_gap=0):
+    """Returns the fewest (min, max) event ranges covering the given events
+
+    Events closer than max_gap are merged into one range, trading a few
+    unwanted events for one less hook.
+    """
+    ranges = []
+    for event in sorted(set(events)):
+        if ranges and event - ranges[-1][1] <= max_gap + 1:
+            ranges[-1][1] = event
+        else:
+            ranges.append([event, event])
+    return [tuple(r) for r in ranges]
+
+
+class EventFilter(object):
+    """Drops events that can never affect a managed window
+
+    Runs on the hook thread before anything is queued, so it only does
+    integer comparisons and a single is_managed lookup.
+    """
+
+    def __init__(self, is_managed, managed_only=(), observe=None):
+        self.is_managed = is_managed
+        # called with (event, hwnd) for every window event, managed or not
+        self.observe = observe
+        # events only relevant to windows that are already managed
+        self.managed_only = frozenset(managed_only)
+        self.accepted = collections.Counter()
+        self.dropped = collections.Counter()
+
+    def accept(self, event, hwnd, id_object, id_child):
+        if id_object != OBJID_WINDOW or id_child != CHILDID_SELF:
+            self.dropped[event] += 1
+            return False
+        if self.observe is not None:
+            self.observe(event, hwnd)
+        if event in self.managed_only and not self.is_managed(hwnd):
+            self.dropped[event] += 1
+            return False
+        self.accepted[event] += 1
+        return True
+
+    def stats(self):
+        return {
+            event: {
+                "accepted": self.accepted[event],
+                "dropped": self.dropped[event]
+            } for event in set(self.accepted) | set(self.dropped)
+        }
+
+
+class EventQueue(object):
+    """Buffers hooked events and dispatches them from a worker thread
+
+    Events are collapsed per window handle while they wait in the queue: a
+    newer event replaces an older one of the same group for the same hwnd,
+    so a drag only dispatches the latest location change and a burst of
+    create/hide/minimize events turns into a single reconcile.
+
+    Delayed calls go through a Scheduler run by the same worker, so nothing
+    ever has to sleep to wait for something.
+    """
+
+    def __init__(self, handlers, groups=None, clock=time.monotonic):
+        # event -> func(hwnd, dwmsEventTime)
+        self.handlers = handlers
+        # event -> group name, events without a group coalesce by event id
+        self.groups = groups if groups is not None else {}
+        self.pending = collections.OrderedDict()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.stopped = False
+        self.scheduler = Scheduler(clock)
+
+        self.received = 0
+        self.coalesced = 0
+        self.dispatched = 0
+
+    @property
+    def depth(self):
+        """Returns the number of events waiting to be dispatched"""
+        return len(self.pending)
+
+    @property
+    def coalescing_ratio(self):
+        """Returns the fraction of received events that were collapsed"""
+        if self.received == 0:
+            return 0.0
+        return self.coalesced / self.received
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "dispatched": self.dispatched,
+            "coalescing_ratio": self.coalescing_ratio
+        }
+
+    def put(self, event, hwnd, id_object, dwmsEventTime):
+        """Queues an event, replacing any pending event it supersedes"""
+        func = self.handlers.get(event)
+        if func is None:
+            return
+        key = (self.groups.get(event, event), hwnd)
+        self.enqueue(key, func, (hwnd, dwmsEventTime))
+
+    def call(self, func, *args, key=None):
+        """Queues func(*args) to run on the worker thread
+
+        Calls sharing a key are coalesced like events, without a key every
+        call is dispatched.
+        """
+        if key is None:
+            key = object()
+        self.enqueue(('call', key), func, args)
+
+    def submit(self, func, *args, key=None):
+        """Queues func(*args) like call() and returns a Future of its result
+
+        Submissions coalesced under one key share the result of the one
+        that runs.
+        """
+        future = concurrent.futures.Future()
+        if self.stopped:
+            future.cancel()
+            return future
+        if key is None:
+            key = object()
+        self.enqueue(('call', key), func, args, future)
+        return future
+
+    def enqueue(self, key, func, args, future=None):
+        with self.condition:
+            self.received += 1
+            futures = [future] if future is not None else []
+            if key in self.pending:
+                # keep only the latest entry, at its latest position
+                futures = self.pending.pop(key)[2] + futures
+                self.coalesced += 1
+            self.pending[key] = (func, args, futures)
+            self.condition.notify()
+
+    def drain(self):
+        """Removes and returns all pending (func, args, futures) in dispatch order"""
+        with self.condition:
+            batch = list(self.pending.values())
+            self.pending.clear()
+        return batch
+
+    def dispatch(self, batch):
+        for func, args, futures in batch:
+            self.dispatched += 1
+            futures = [f for f in futures if f.set_running_or_notify_cancel()]
+            try:
+                result = func(*args)
+            except Exception as e:
+                log.exception('error running %s%s', getattr(func, '__name__', func), args)
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future in futures:
+                    future.set_result(result)
+
+    def dispatch_pending(self):
+        """Dispatches everything queued so far and every scheduled call that is due"""
+        batch = self.drain()
+        with self.condition:
+            due = self.scheduler.pop_due()
+        self.dispatch(batch)
+        self.dispatch([(call.func, call.args, ()) for call in due])
+        return len(batch) + len(due)
+
+    def call_later(self, delay, func, *args, key=None):
+        """Queues func(*args) to run on the worker thread after delay seconds
+
+        A pending call with the same key is replaced, which debounces it.
+        """
+        with self.condition:
+            call = self.scheduler.call_later(delay, func, *args, key=key)
+            self.condition.notify()
+        return call
+
+    def cancel(self, key):
+        with self.condition:
+            self.scheduler.cancel(key)
+
+    def is_scheduled(self, key):
+        with self.condition:
+            return self.scheduler.is_scheduled(key)
+
+    def remaining(self, key):
+        """Returns the seconds until the call with key runs, or None"""
+        with self.condition:
+            return self.scheduler.remaining(key)
+
+    def set_timer(self, interval, func, key='timer'):
+        """Calls func on the worker thread every interval seconds
+
+        Setting a timer again with the same key replaces it.
+        """
+        with self.condition:
+            self.scheduler.every(interval, func, key=key)
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    timeout = self.scheduler.next_due()
+                    if timeout is None:
+                        self.condition.wait()
+                        continue
+                    if timeout <= 0:
+                        break
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+            self.dispatch_pending()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+        # nobody will run what is left, don't leave submitters waiting
+        for _, _, futures in self.drain():
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,260 @@
+"""Contains the CallGuard class that keeps hung windows from stalling wmpy
+
+Moving or restyling a window sends messages to its app, so the call blocks
+for as long as the app does not answer. CallGuard runs those calls on a
+small pool of threads and waits only HungWindowTimeout for each. A window
+whose call timed out, or that Windows reports as hung, is sent moves with
+SWP_ASYNCWINDOWPOS from then on, which never blocks, and its tile is
+retried until it answers again.
+"""
+import concurrent.futures
+import queue
+import threading
+import time
+
+from wmpy.constants import SWP_ASYNCWINDOWPOS
+
+from wmpy.backend import BackendError
+import wmpy.backend as backend
+from wmpy.log import get_logger
+from wmpy.metrics import metrics
+
+log = get_logger(__name__)
+
+# threads for calls to windows, enough for one batch per monitor at once
+WORKERS = 8
+# calls that timed out and still hold a thread, no more are started beyond
+MAX_STUCK = 4
+
+
+class WindowTimeout(BackendError):
+    """Raised when a window did not answer a call in time"""
+
+
+class DaemonPool(object):
+    """Runs calls on up to workers daemon threads, started as they are needed
+
+    Unlike a ThreadPoolExecutor, a thread stuck on a hung app does not keep
+    the interpreter from exiting.
+    """
+
+    def __init__(self, workers, name):
+        self.workers = workers
+        self.name = name
+        self.tasks = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.threads = 0
+        self.idle = 0
+
+    def submit(self, func, *args):
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self.idle == 0 and self.threads < self.workers:
+                self.threads += 1
+                self.idle += 1
+                threading.Thread(target=self.__run, daemon=True,
+                                 name='{0}-{1}'.format(self.name, self.threads)).start()
+            self.idle -= 1
+        self.tasks.put((future, func, args))
+        return future
+
+    def __run(self):
+        while True:
+            future, func, args = self.tasks.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = func(*args)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            with self.lock:
+                self.idle += 1
+
+
+class PendingCall(object):
+    """A call started by CallGuard.submit(), result() waits for it"""
+
+    def __init__(self, guard, hwnds, func, args):
+        self.guard = guard
+        self.hwnds = hwnds
+        self.func = func
+        self.started = time.perf_counter()
+        # perf_counter() when the call returned, None while it runs
+        self.finished = None
+        # backend calls it made, counted for the thread waiting for it
+        self.calls = 0
+        self.future = guard.pool.submit(self.__run, args)
+
+    def __run(self, args):
+        calls = metrics.thread_calls()
+        try:
+            return self.func(*args)
+        finally:
+            self.calls = metrics.thread_calls() - calls
+            self.finished = time.perf_counter()
+
+    def result(self):
+        """Returns what the call returned, waiting until timeout after it started
+
+        Raises WindowTimeout if it did not return by then.
+        """
+        remaining = self.started + self.guard.timeout - time.perf_counter()
+        try:
+            result = self.future.result(max(remaining, 0))
+        except concurrent.futures.TimeoutError:
+            pass
+        except BaseException:
+            metrics.add_thread_calls(self.calls)
+            raise
+        else:
+            metrics.add_thread_calls(self.calls)
+            return result
+        self.guard.timed_out(self)
+        raise WindowTimeout(0, 'no answer within {0}s'.format(self.guard.timeout))
+
+
+class CallGuard(object):
+    """Runs blocking window calls with a timeout and tracks hung windows
+
+    Normally this adds only a thread handoff per call. IsHungAppWindow is
+    only asked about windows that timed out or are waiting for a retry.
+    """
+
+    def __init__(self, timeout=0.25, workers=WORKERS, max_stuck=MAX_STUCK):
+        self.timeout = timeout
+        self.workers = workers
+        self.max_stuck = max_stuck
+        self.pool = None
+        self.lock = threading.Lock()
+        # hwnd -> calls to it still running after they timed out
+        self.busy = {}
+        self.stuck = 0
+        # hwnds known to be hung, until they answer again
+        self.hung = set()
+        # hwnd -> what to call again for a move that did not happen or was
+        # only posted, None to retile it
+        self.deferred = {}
+        self.timeouts = 0
+        self.posted = 0
+        self.retries = 0
+
+    def is_hung(self, hwnd):
+        """True if hwnd timed out before and did not answer since"""
+        hwnd = int(hwnd)
+        return hwnd in self.hung or hwnd in self.busy
+
+    def call(self, hwnds, func, *args):
+        """Returns func(*args), a call sending messages to hwnds
+
+        Raises WindowTimeout if it does not return within timeout, the call
+        keeps running and hwnds count as hung until it does.
+        """
+        return self.submit(hwnds, func, *args).result()
+
+    def submit(self, hwnds, func, *args):
+        """Starts func(*args) like call() but returns a PendingCall right away
+
+        Several calls submitted together run at the same time and share the
+        timeout, it counts from each submit().
+        """
+        hwnds = [int(h) for h in hwnds]
+        with self.lock:
+            if self.stuck >= self.max_stuck:
+                # too many threads wait for hung apps, do not queue behind them
+                raise WindowTimeout(0, 'too many window call threads are stuck')
+            if self.pool is None:
+                self.pool = DaemonPool(self.workers, 'wmpy-call')
+        return PendingCall(self, hwnds, func, args)
+
+    def timed_out(self, pending):
+        """Counts the hung hwnds of a call that did not return in time as busy until it does
+
+        Windows only reports an app as hung after a few seconds, until then
+        every hwnd of the call counts.
+        """
+        hwnds = self.find_hung(pending.hwnds) or pending.hwnds
+        with self.lock:
+            self.stuck += 1
+            self.timeouts += 1
+            for hwnd in hwnds:
+                self.busy[hwnd] = self.busy.get(hwnd, 0) + 1
+        pending.future.add_done_callback(lambda f: self.__returned(hwnds, pending.hwnds))
+        metrics.count('hung.timeouts')
+        log.warning('%s did not return within %.0f ms for %s',
+                    getattr(pending.func, '__name__', pending.func),
+                    self.timeout * 1000, hwnds)
+
+    def __returned(self, hwnds, called):
+        with self.lock:
+            self.stuck -= 1
+            for hwnd in hwnds:
+                if self.busy[hwnd] == 1:
+                    del self.busy[hwnd]
+                else:
+                    self.busy[hwnd] -= 1
+            # it may have moved every window it was given to where a later
+            # tile no longer wants them
+            for hwnd in called:
+                self.deferred.setdefault(hwnd, None)
+
+    def post(self, hwnd, insert_after, rect, flags):
+        """SetWindowPos for a hung window, queued with its app instead of waiting"""
+        backend.get().set_window_pos(hwnd, insert_after, rect, flags | SWP_ASYNCWINDOWPOS)
+        self.defer(hwnd, posted=True)
+
+    def find_hung(self, hwnds):
+        """Asks Windows which of hwnds are hung, e.g. after a call timed out"""
+        desktop = backend.get()
+        found = []
+        for hwnd in hwnds:
+            try:
+                if desktop.is_hung(hwnd):
+                    found.append(int(hwnd))
+            except BackendError:
+                pass
+        self.hung.update(found)
+        return found
+
+    def defer(self, hwnd, posted=False, retry=None):
+        """Remembers to retry the move of hwnd, by calling retry if given"""
+        hwnd = int(hwnd)
+        with self.lock:
+            if retry is not None or hwnd not in self.deferred:
+                self.deferred[hwnd] = retry
+        if posted:
+            self.posted += 1
+            metrics.count('hung.posted')
+
+    def take_retries(self):
+        """Forgets hung windows that answer again, returns {hwnd: retry} of deferred moves"""
+        if not self.deferred and not self.hung:
+            return {}
+        desktop = backend.get()
+        for hwnd in list(self.hung):
+            try:
+                answers = not desktop.is_hung(hwnd)
+            except BackendError:
+                # destroyed
+                answers = True
+            if answers and hwnd not in self.busy:
+                self.hung.discard(hwnd)
+        with self.lock:
+            retries, self.deferred = self.deferred, {}
+        self.retries += len(retries)
+        metrics.count('hung.retries', len(retries))
+        return retries
+
+    def stats(self):
+        return {
+            "hung": len(self.hung),
+            "busy": len(self.busy),
+            "stuck_threads": self.stuck,
+            "deferred": len(self.deferred),
+            "timeouts": self.timeouts,
+            "posted": self.posted,
+            "retries": self.retries
+        }
+
+
+guard = CallGuard()
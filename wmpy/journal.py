@@ -0,0 +1,272 @@
+"""Contains the LayoutJournal class and the crash restore entry point
+
+The journal is an append-only file with one JSON line per change to a
+managed window:
+
+    {"hwnd": 1234, "classname": "Notepad", "title": "...", "start": [l, t, r, b],
+     "rect": [l, t, r, b], "floating": false, "decorated": true}
+    {"hwnd": 1234, "removed": true}
+
+start is where the window was before wmpy first tiled it, rect where wmpy
+last put it. The last line for a hwnd wins and a line cut short by a crash
+is skipped. Once most lines are superseded the file is rewritten with one
+line per window. A clean exit restores every window and deletes the file.
+
+Set "JournalFile" in config.json. A restarted wmpy takes over the windows
+in the journal. To put them back without starting wmpy, e.g. after a
+crash, run
+
+    python -m wmpy.journal restore [FILE]
+
+while wmpy is not running. Windows that could not be restored, e.g. because
+their app hangs, stay in the file for another try.
+"""
+import argparse
+import json
+import os
+import sys
+
+from wmpy.constants import HWND_NOTOPMOST
+
+from wmpy.backend import BackendError
+import wmpy.backend as backend
+from wmpy.log import get_logger
+from wmpy.placement import Placement
+from wmpy.window import Window
+
+log = get_logger(__name__)
+
+# rewrite the file once it holds this many lines per window
+COMPACT_RATIO = 4
+# but never for fewer lines than this
+COMPACT_MIN_LINES = 256
+
+
+def read_journal(path):
+    """Returns ({hwnd: entry}, number of lines) of a journal, empty if there is none"""
+    entries = {}
+    lines = 0
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # cut short by a crash while writing
+                    continue
+                if record.get("removed"):
+                    entries.pop(record["hwnd"], None)
+                else:
+                    entries[record["hwnd"]] = record
+    except FileNotFoundError:
+        pass
+    return entries, lines
+
+
+def dump(record):
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+class LayoutJournal(object):
+    """Mirrors what wmpy changed about every managed window to a file
+
+    sync() compares the tilers with what was written last and appends only
+    the differences, so it can run on a timer. The only backend call it
+    makes is for the title of a window it has not seen before.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries, self.lines = read_journal(path)
+        # left by a wmpy that did not exit cleanly, until recover() ran
+        self.previous = dict(self.entries)
+        self.file = None
+        self.compactions = 0
+
+    def recover(self, tilers):
+        """Takes over windows from the previous run, returns how many"""
+        recovered = 0
+        for t in tilers:
+            for window in list(t.windows):
+                entry = self.previous.get(int(window.handle))
+                if entry is None or entry["classname"] != window.classname:
+                    # the handle was reused by another window
+                    continue
+                t.recover_window(
+                    window,
+                    tuple(entry["start"]) if entry["start"] else None,
+                    entry["floating"],
+                    entry["decorated"],
+                    tuple(entry["rect"]) if entry["rect"] else None)
+                recovered += 1
+        self.previous = {}
+        return recovered
+
+    def __record(self, window, tiler, old):
+        if old is not None and old["classname"] == window.classname:
+            # first seen wins, a window moved between monitors keeps its start
+            start = old["start"]
+            title = old["title"]
+        else:
+            start = tiler.start_positions.get(window)
+            start = list(start) if start is not None else None
+            title = window.title
+        rect = tiler.applied.get(window)
+        return {
+            "hwnd": int(window.handle),
+            "classname": window.classname,
+            "title": title,
+            "start": start,
+            "rect": list(rect) if rect is not None else None,
+            "floating": window.floating,
+            "decorated": window.is_decorated
+        }
+
+    def sync(self, tilers):
+        """Appends whatever changed since the last sync, returns the number of lines"""
+        records = []
+        seen = set()
+        for t in tilers:
+            for window in t.windows:
+                hwnd = int(window.handle)
+                seen.add(hwnd)
+                old = self.entries.get(hwnd)
+                record = self.__record(window, t, old)
+                if record != old:
+                    self.entries[hwnd] = record
+                    records.append(record)
+        for hwnd in [h for h in self.entries if h not in seen]:
+            del self.entries[hwnd]
+            records.append({"hwnd": hwnd, "removed": True})
+        if records:
+            self.__append(records)
+        return len(records)
+
+    def __append(self, records):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(''.join(dump(r) for r in records))
+        # a crash of wmpy, not of Windows, must not lose it
+        self.file.flush()
+        self.lines += len(records)
+        if self.lines > max(COMPACT_MIN_LINES, COMPACT_RATIO * len(self.entries)):
+            self.compact()
+
+    def compact(self):
+        """Rewrites the file with a single line per window"""
+        self.close()
+        temp = self.path + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            f.write(''.join(dump(entry) for entry in self.entries.values()))
+        os.replace(temp, self.path)
+        self.lines = len(self.entries)
+        self.compactions += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def discard(self):
+        """Deletes the journal, e.g. once every window was restored"""
+        self.close()
+        self.entries = {}
+        self.lines = 0
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        return {
+            "windows": len(self.entries),
+            "lines": self.lines,
+            "compactions": self.compactions
+        }
+
+
+def restore(entries):
+    """Moves every journaled window that still exists back to its start, in one batch
+
+    Returns the entries restored, the ones that failed and the ones whose
+    window is gone.
+    """
+    desktop = backend.get()
+    placement = Placement()
+    windows = {}
+    failed = []
+    missing = []
+    for hwnd, entry in entries.items():
+        window = Window(hwnd)
+        try:
+            exists = desktop.is_window(hwnd) and window.classname == entry["classname"]
+        except BackendError:
+            exists = False
+        if not exists or entry["start"] is None:
+            missing.append(entry)
+            continue
+        if not entry["decorated"]:
+            window.is_decorated = False
+            if not window.enable_decoration():
+                failed.append(entry)
+                continue
+        placement.add(window, entry["start"],
+                      HWND_NOTOPMOST if entry["floating"] else None)
+        windows[window] = entry
+    placement.commit()
+    for window in placement.deferred:
+        # its move was only posted, done unless the app still hangs
+        try:
+            moved = desktop.get_window_rect(window.handle) == tuple(windows[window]["start"])
+        except BackendError:
+            moved = False
+        if not moved:
+            placement.failed.append(window)
+    for window in placement.failed:
+        log.warning('error restoring %s', window.handle)
+        failed.append(windows.pop(window))
+    return list(windows.values()), failed, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Shows or restores the windows in a wmpy layout journal')
+    parser.add_argument('command', choices=('show', 'restore'))
+    parser.add_argument('path', nargs='?',
+                        help='journal file, JournalFile from config.json by default')
+    args = parser.parse_args()
+    path = args.path
+    if path is None:
+        import wmpy.config as config
+        config.ensure_loaded()
+        path = config.JOURNAL_FILE()
+        if path is None:
+            parser.error('no journal file given and JournalFile is not set')
+
+    entries, _ = read_journal(path)
+    if not entries:
+        print('{0} lists no windows'.format(path))
+        return
+    if args.command == 'show':
+        for entry in entries.values():
+            print('{0:>10} {1:<24} {2:<8} {3} -> {4}  {5}'.format(
+                entry["hwnd"], entry["classname"],
+                'floating' if entry["floating"] else 'tiled',
+                entry["start"], entry["rect"], entry["title"]))
+        return
+    restored, failed, missing = restore(entries)
+    print('restored {0} window(s), {1} failed, {2} no longer exist'.format(
+        len(restored), len(failed), len(missing)))
+    if not failed:
+        os.remove(path)
+        return
+    # keep what failed for another try
+    journal = LayoutJournal(path)
+    journal.entries = {entry["hwnd"]: entry for entry in failed}
+    journal.compact()
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Contains the logging setup for wmpy
+
+Modules log through get_logger(__name__) with %-style arguments, so nothing
+is formatted unless the level is enabled; lazy() defers building expensive
+arguments the same way. setup() installs an in-memory ring buffer of recent
+records and, optionally, a file and the console. Both of those are written
+by a listener thread, so logging on the event path never waits on I/O.
+"""
+import atexit
+import collections
+import logging
+import sys
+
+ROOT = 'wmpy'
+FORMAT = '%(asctime)s %(levelname)-7s %(threadName)s %(name)s: %(message)s'
+
+ring = None
+listener = None
+
+
+class lazy(object):
+    """Calls func(*args) only when the log message is actually formatted"""
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last capacity records, laid out with the formatter only when read"""
+
+    def __init__(self, capacity):
+        super(RingBufferHandler, self).__init__()
+        self.records = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        # format the message now, later its arguments may have changed
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        self.records.append(record)
+
+    def lines(self, count=None):
+        records = list(self.records)
+        if count is not None:
+            records = records[-count:]
+        return [self.format(r) for r in records]
+
+
+def get_logger(name):
+    if not name.startswith(ROOT):
+        name = ROOT + '.' + name
+    return logging.getLogger(name)
+
+
+def setup(level='WARNING', path=None, ring_size=1000, console=True):
+    """Configures wmpy logging, calling it again replaces the previous setup"""
+    global ring, listener
+    shutdown()
+    logger = logging.getLogger(ROOT)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    formatter = logging.Formatter(FORMAT)
+
+    ring = RingBufferHandler(ring_size)
+    ring.setFormatter(formatter)
+    logger.addHandler(ring)
+
+    sinks = []
+    if path:
+        sinks.append(logging.FileHandler(path, encoding='utf-8'))
+    if console and sys.stderr is not None:
+        sinks.append(logging.StreamHandler(sys.stderr))
+    if sinks:
+        # not needed for the ring buffer alone, so only imported here
+        from logging.handlers import QueueHandler, QueueListener
+        import queue
+        records = queue.Queue()
+        logger.addHandler(QueueHandler(records))
+        for sink in sinks:
+            sink.setFormatter(formatter)
+        listener = QueueListener(records, *sinks)
+        listener.start()
+
+
+def set_level(level):
+    logging.getLogger(ROOT).setLevel(level)
+
+
+def recent_lines(count=None):
+    """Returns the last count formatted records from the ring buffer"""
+    if ring is None:
+        return []
+    return ring.lines(count)
+
+
+def shutdown():
+    """Flushes and stops the file and console sinks"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        for sink in listener.handlers:
+            sink.close()
+        listener = None
+
+
+atexit.register(shutdown)
@@ -1,186 +1,576 @@
-import time
+import json
+import re
 import threading
-import sys
-import win32gui
-import win32api
-import ctypes
-import ctypes.wintypes
-
-from win32con import EVENT_MIN
-from win32con import EVENT_MAX
-from win32con import WINEVENT_OUTOFCONTEXT
-from win32con import WM_QUIT
-from win32con import MONITOR_DEFAULTTONEAREST
-
-from win32con import EVENT_OBJECT_CREATE
-from win32con import EVENT_OBJECT_DESTROY
-from win32con import EVENT_OBJECT_SHOW
-from win32con import EVENT_OBJECT_HIDE
-from win32con import EVENT_OBJECT_FOCUS
-from win32con import EVENT_OBJECT_LOCATIONCHANGE
-from win32con import EVENT_SYSTEM_MINIMIZEEND
-from win32con import EVENT_SYSTEM_MINIMIZESTART
-from win32con import EVENT_SYSTEM_DRAGDROPSTART
-from win32con import EVENT_SYSTEM_DRAGDROPEND
+import time
 
+from wmpy.constants import EVENT_OBJECT_CREATE
+from wmpy.constants import EVENT_OBJECT_SHOW
+from wmpy.constants import EVENT_OBJECT_HIDE
+from wmpy.constants import EVENT_OBJECT_LOCATIONCHANGE
+from wmpy.constants import EVENT_OBJECT_NAMECHANGE
+from wmpy.constants import EVENT_SYSTEM_MINIMIZEEND
+from wmpy.constants import EVENT_SYSTEM_MINIMIZESTART
+from wmpy.constants import EVENT_SYSTEM_DRAGDROPSTART
+from wmpy.constants import EVENT_SYSTEM_DRAGDROPEND
+
+from wmpy.backend import BackendError
+import wmpy.backend as backend
+from wmpy.cache import window_cache, INVALIDATED_BY
+from wmpy.events import EventQueue, EventFilter, event_name, plan_hook_ranges
+from wmpy.guard import guard
+from wmpy.log import get_logger, recent_lines, set_level
+from wmpy.metrics import metrics, PhaseTimer
 from wmpy.monitor import Monitor
+from wmpy.placement import Placement
+from wmpy.registry import WindowRegistry
+from wmpy.reloader import ConfigWatcher
+from wmpy.snapshot import DesktopSnapshot
 from wmpy.window import Window
-from wmpy.tiler import Tiler, check_overlap, overlap_area
+from wmpy.spatial import GridIndex, check_overlap, overlap_area
+from wmpy.tiler import Tiler
 import wmpy.config as config
 
+log = get_logger(__name__)
+
+# events that only require the window list to be reconciled, a burst of any
+# of them for one window is dispatched once
+RECONCILE_EVENTS = (
+    EVENT_OBJECT_CREATE,
+    EVENT_OBJECT_SHOW,
+    EVENT_OBJECT_HIDE,
+    EVENT_SYSTEM_MINIMIZESTART,
+    EVENT_SYSTEM_MINIMIZEEND
+)
+# settings that change the region of every window
+RELAYOUT_SETTINGS = frozenset((
+    "DisplayPadding",
+    "WindowMargin",
+    "WindowSplitRatio"
+))
+# events that only matter if the window is already being tiled
+MANAGED_ONLY_EVENTS = (
+    EVENT_OBJECT_LOCATIONCHANGE,
+    EVENT_OBJECT_HIDE,
+    EVENT_OBJECT_NAMECHANGE,
+    EVENT_SYSTEM_MINIMIZESTART
+)
+
 
 class WindowManager(object):
 
-    def __init__(self):
-        self.lastWindowSwap = 0
+    def __init__(self, menu=None, startup=None):
+        # MenuModel kept current for the tray, None when running headless
+        self.menu = menu
+        # startup breakdown, continued from the caller's when given
+        self.startup = startup if startup is not None else PhaseTimer()
+        self.recorder = None
+        self.config_watcher = None
+        self.journal = None
+        config.ensure_loaded()
+        if config.METRICS():
+            metrics.enable()
+        guard.timeout = config.HUNG_WINDOW_TIMEOUT() / 1000
 
         monitors = Monitor.get_displays()
+        self.startup.mark('monitors')
+        # one enumeration for all monitors
+        snapshot = DesktopSnapshot.capture(monitors)
+        self.startup.mark('discovery')
+        # every managed window by handle, shared by all tilers
+        self.registry = WindowRegistry(menu)
         self.tilers = []
         for monitor in monitors:
-            self.tilers.append(Tiler(monitor))
+            self.tilers.append(Tiler(monitor, snapshot, self.registry))
+        if self.menu is not None:
+            self.menu.set_monitors([t.monitor for t in self.tilers])
+        # monitor rect -> tiler, monitors are large so use large cells
+        self.monitor_index = GridIndex(cell_size=1024)
+        self.index_monitors()
+        self.startup.mark('tilers')
+
+    def index_monitors(self):
+        self.monitor_index.clear()
+        for t in self.tilers:
+            if t.monitor.display_resolution is not None:
+                self.monitor_index.insert(t, t.monitor.display_resolution)
 
     def get_monitor_from_window_handle(self, hwnd):
-        mhwnd = win32api.MonitorFromWindow(hwnd, MONITOR_DEFAULTTONEAREST)
+        mhwnd = backend.get().monitor_from_window(hwnd)
         for t in self.tilers:
             if t.monitor.handle == mhwnd:
                 return t.monitor
         return None
 
+    def get_tiler_from_window(self, window):
+        """Returns the tiler of the monitor the window overlaps most
+
+        Like MonitorFromWindow, which is only asked when the window is
+        outside every monitor.
+        """
+        best = self.monitor_index.best_overlap(window.display_size)
+        if best is not None:
+            return best[0]
+        return self.get_tiler_from_window_handle(window.handle)
+
     def get_tiler_from_window_handle(self, hwnd):
-        monitorHwnd = win32api.MonitorFromWindow(
-            hwnd, MONITOR_DEFAULTTONEAREST)
+        monitorHwnd = backend.get().monitor_from_window(hwnd)
         for t in self.tilers:
             if t.monitor.handle == monitorHwnd:
                 return t
         return None
 
-    def print_event(self, hwnd, dwmsEventTime):
-        print(hwnd)
+    def is_managed(self, hwnd):
+        return hwnd in self.registry
+
+    def log_event(self, hwnd, dwmsEventTime):
+        log.debug('drag and drop on %s', hwnd)
 
     def on_create_object(self, hwnd, dwmsEventTime):
-        # this is so dirty, but can't get anything else to work :/
+        self.reconcile_window(hwnd)
+
+    def on_name_change(self, hwnd, dwmsEventTime):
+        window = self.registry.get(hwnd)
+        if window is not None:
+            self.menu.window_retitled(window)
+
+    def reconcile_window(self, hwnd):
+        """Adds, removes or moves a single window to match its current state"""
+        window = self.registry.get(hwnd)
+        owner = None
+        if window is None:
+            window = Window(hwnd)
+        else:
+            owner = window.tiler
+
+        target = None
+        if window.should_manage(None):
+            try:
+                target = self.get_tiler_from_window(window)
+            except BackendError:
+                target = None
+            if target is not None and not target.valid_window_by_handle(hwnd):
+                target = None
+
+        if owner is target:
+            return
+        if owner is not None and owner.remove_window(window):
+            owner.tile_windows()
+        if target is not None and target.add_window(window):
+            target.tile_windows()
+
+    @metrics.timed('resync', count_calls=True)
+    def resync(self):
+        """Rebuilds every tiler's window list from a full enumeration"""
+        snapshot = DesktopSnapshot.capture([t.monitor for t in self.tilers])
         for t in self.tilers:
             retile = False
-            current = [w for w in t.windows]
-            new = []
-            for w in Window.get_windows_from_monitor(t.monitor):
-                new.append(w)
-            for w in new:
-                if w not in current:
-                    result = t.add_window(w)
-                    if result:
-                        retile = True
-            for w in current:
-                if w not in new:
-                    result = t.remove_window(w)
-                    if result:
-                        retile = True
+            current = set(t.windows)
+            new = set(Window.get_windows_from_monitor(t.monitor, snapshot))
+            for w in new - current:
+                if t.add_window(w):
+                    retile = True
+            for w in current - new:
+                if t.remove_window(w):
+                    retile = True
             if retile:
                 t.tile_windows()
 
     def on_location_change(self, hwnd, dwmsEventTime):
+        window = self.registry.get(hwnd)
+        if window is None:
+            return
+        t = window.tiler
+        # the only window queried, everything else comes from indexes
+        rect = window.display_size
+        if rect != t.applied.get(window):
+            # moved by the user or the app, next tile must move it back
+            t.mark_moved(window)
+        if check_overlap(t.monitor.display_size, rect):
+            area = overlap_area(t.monitor.display_size, rect)
+            if area / window.display_area < config.DISPLAY_SWAP_OVERLAP_THRESHOLD():
+                # swap displays
+                self.__swap_displays(t, hwnd)
+                return
+            elif not self.events.is_scheduled('swap cooldown'):
+                # moved on current monitor
+                other = t.find_swap_target(
+                    window, rect, config.WINDOW_SWAP_OVERLAP_THRESHOLD())
+                if other is not None:
+                    # swap windows, then ignore swaps for WindowSwapTimeout ms,
+                    # the cooldown is over when the pending call runs
+                    self.events.call_later(
+                        config.WINDOW_SWAP_TIMEOUT() / 1000, lambda: None, key='swap cooldown')
+                    t.swap_windows(window, other)
+                return
+            else:
+                # retile once the cooldown is over, not on every move
+                self.events.call_later(
+                    self.events.remaining('swap cooldown') or 0,
+                    t.tile_windows, key=('retile', t))
+        else:
+            # no overlap, swap displays
+            self.__swap_displays(t, hwnd)
+            return
+
+    @metrics.timed('on_display_change', count_calls=True)
+    def on_display_change(self):
+        """Refreshes monitor geometry and retiles monitors that changed"""
+        displays = Monitor.get_displays()
+        if displays is None:
+            return
+        handles = set(int(m.handle) for m in displays)
+        known = set(int(t.monitor.handle) for t in self.tilers)
+
+        orphans = []
+        for t in [t for t in self.tilers if int(t.monitor.handle) not in handles]:
+            # monitor was disconnected
+            self.tilers.remove(t)
+            for window in list(t.windows):
+                t.remove_window(window)
+                orphans.append(window)
+        claimed = []
+        if handles != known:
+            snapshot = DesktopSnapshot.capture(displays)
+            for monitor in displays:
+                if int(monitor.handle) not in known:
+                    # a new tiler leaves windows another one owns to reconcile_window
+                    claimed.extend(w.handle for w in monitor.get_window_positions(snapshot)
+                                   if w.handle in self.registry)
+                    self.tilers.append(Tiler(monitor, snapshot, self.registry))
+
         for t in self.tilers:
-            if t.contains_window_by_handle(hwnd):
-                window = t.get_window_from_handle(hwnd)
-                if check_overlap(t.monitor.display_size, window.display_size):
-                    area = overlap_area(
-                        t.monitor.display_size, window.display_size)
-                    if area / window.display_area < config.DISPLAY_SWAP_OVERLAP_THRESHOLD():
-                        # swap displays
-                        self.__swap_displays(t, hwnd)
-                        return
-                    elif dwmsEventTime - self.lastWindowSwap > config.WINDOW_SWAP_TIMEOUT():
-                        # moved on current monitor
-                        for w in t.windows:
-                            if w != window and check_overlap(w.display_size, window.display_size):
-                                area = overlap_area(
-                                    w.display_size, window.display_size)
-                                if area / window.display_area >= config.WINDOW_SWAP_OVERLAP_THRESHOLD() or area / w.display_area >= config.WINDOW_SWAP_OVERLAP_THRESHOLD():
-                                    # swap windows
-                                    self.lastWindowSwap = dwmsEventTime
-                                    t.swap_windows(window, w)
-                                    break
-                        return
-                    else:
-                        t.tile_windows()
-                else:
-                    # no overlap, swap displays
-                    self.__swap_displays(t, hwnd)
-                    return
+            t.monitor.refresh()
+        self.index_monitors()
+        # only now the removed monitors are out of the index
+        for hwnd in [w.handle for w in orphans] + claimed:
+            self.reconcile_window(hwnd)
+        if self.menu is not None:
+            self.menu.set_monitors([t.monitor for t in self.tilers])
+        for t in self.tilers:
+            if t.needs_relayout():
+                t.tile_windows()
 
     def __swap_displays(self, tiler, window_hwnd):
         tiler.remove_window_by_handle(window_hwnd)
-        time.sleep(config.DISPLAY_MOVE_TIMEOUT())
-        tiler.tile_windows()
-        self.on_create_object(window_hwnd, None)
+        # let the window settle on the new display without blocking other events
+        self.events.call_later(
+            config.DISPLAY_MOVE_TIMEOUT(), self.finish_display_move, tiler, window_hwnd,
+            key=('display move', window_hwnd))
 
-    def start(self):
-        for tiler in self.tilers:
+    def finish_display_move(self, tiler, window_hwnd):
+        if tiler in self.tilers:
             tiler.tile_windows()
+        self.reconcile_window(window_hwnd)
+
+    def tile_all(self, relayout=False):
+        """Tiles every monitor, the layouts of all first and then their moves at once
+
+        Each monitor's moves are one batch and the batches run concurrently,
+        so this takes as long as the slowest monitor instead of their sum.
+        """
+        placements = []
+        for t in self.tilers:
+            placement = Placement()
+            t.tile_windows(relayout, placement)
+            if placement:
+                placements.append((t, placement))
+        started = time.perf_counter()
+        for _, placement in placements:
+            placement.send()
+        # wait for every monitor before the next event may move windows again
+        for t, placement in placements:
+            placement.finish()
+            t.placement_ms = placement.seconds * 1000
+            metrics.observe('placement.monitor', placement.seconds)
+            for window in placement.failed + placement.deferred:
+                t.mark_moved(window)
+        if placements:
+            metrics.observe('placement.all', time.perf_counter() - started)
+
+    def start(self):
+        if config.JOURNAL_FILE():
+            from wmpy.journal import LayoutJournal
+            self.journal = LayoutJournal(config.JOURNAL_FILE())
+            recovered = self.journal.recover(self.tilers)
+            if recovered:
+                log.info('took over %d window(s) from %s', recovered, config.JOURNAL_FILE())
+            self.startup.mark('journal')
+        self.tile_all()
+        self.startup.mark('first tile')
+        self.init_events()
+        if self.journal is not None:
+            # the first sync reads every title, keep it off the startup path
+            self.events.call(self.sync_journal, key='journal sync')
+            self.events.set_timer(config.JOURNAL_INTERVAL(), self.sync_journal, key='journal')
+
+        self.recorder = None
+        if config.TRACE_FILE():
+            from wmpy.trace import TraceRecorder
+            self.recorder = TraceRecorder(config.TRACE_FILE())
+            self.recorder.start()
+        self.config_watcher = ConfigWatcher(
+            self.handle_config_change, config.CONFIG_RELOAD_INTERVAL())
+        self.config_watcher.start()
+        self.events.start()
+        thread = threading.Thread(target=self.msg_loop)
+        thread.start()
+        self.thread_id = thread.ident
+        self.startup.mark('events')
+        log.info('startup: %s', self.startup)
+        return thread.ident
 
+    def init_events(self):
+        """Creates the event queue, filter and hook ranges used by start()"""
         MESSAGE_MAP = {
             EVENT_OBJECT_CREATE: self.on_create_object,
+            EVENT_OBJECT_SHOW: self.on_create_object,
             EVENT_OBJECT_LOCATIONCHANGE: self.on_location_change,
             EVENT_SYSTEM_MINIMIZESTART: self.on_create_object,
             EVENT_SYSTEM_MINIMIZEEND: self.on_create_object,
             EVENT_OBJECT_HIDE: self.on_create_object,
-            EVENT_SYSTEM_DRAGDROPSTART: self.print_event,
-            EVENT_SYSTEM_DRAGDROPEND: self.print_event
+            EVENT_SYSTEM_DRAGDROPSTART: self.log_event,
+            EVENT_SYSTEM_DRAGDROPEND: self.log_event
         }
+        if self.menu is not None:
+            # only the tray shows titles
+            MESSAGE_MAP[EVENT_OBJECT_NAMECHANGE] = self.on_name_change
+        MESSAGE_MAP = {event: self.__instrumented(event, func)
+                       for event, func in MESSAGE_MAP.items()}
+        self.events = EventQueue(
+            MESSAGE_MAP, {event: 'reconcile' for event in RECONCILE_EVENTS})
+        # events are handled per window, catch anything missed periodically
+        self.events.set_timer(config.RESYNC_INTERVAL(), self.resync)
+        self.events.set_timer(config.HUNG_RETRY_INTERVAL(), self.retry_hung, key='hung retry')
+        self.event_filter = EventFilter(
+            self.is_managed, MANAGED_ONLY_EVENTS, window_cache.invalidate)
+        # only hook the events we handle or that invalidate cached
+        # window properties, not EVENT_MIN..EVENT_MAX
+        self.hook_ranges = plan_hook_ranges(
+            set(MESSAGE_MAP) | set(INVALIDATED_BY))
 
-        user32 = ctypes.windll.user32
-        ole32 = ctypes.windll.ole32
+    def __instrumented(self, event, func):
+        """Wraps an event handler to time it and the wait in the queue"""
+        timed = metrics.timed('handler.' + event_name(event), count_calls=True)(func)
 
-        ole32.CoInitialize(0)
+        def handler(hwnd, dwmsEventTime):
+            if metrics.enabled:
+                lag = (backend.get().tick_count() - dwmsEventTime) & 0xFFFFFFFF
+                metrics.observe('queue lag', lag / 1000)
+            return timed(hwnd, dwmsEventTime)
+        handler.__name__ = func.__name__
+        return handler
 
-        WinEventProcType = ctypes.WINFUNCTYPE(
-            None,
-            ctypes.wintypes.HANDLE,
-            ctypes.wintypes.DWORD,
-            ctypes.wintypes.HWND,
-            ctypes.wintypes.LONG,
-            ctypes.wintypes.LONG,
-            ctypes.wintypes.DWORD,
-            ctypes.wintypes.DWORD
-        )
+    def retry_hung(self):
+        """Retries moves of windows that were hung or timed out"""
+        tilers = set()
+        for hwnd, retry in guard.take_retries().items():
+            if retry is not None:
+                retry()
+                continue
+            window = self.registry.get(hwnd)
+            if window is not None and window.tiler is not None:
+                # where it is is unknown, a stuck batch may have landed late
+                window.tiler.mark_moved(window)
+                tilers.add(window.tiler)
+        for t in tilers:
+            t.tile_windows()
 
-        def win_error(result, func, args):
-            if not result:
-                raise ctypes.WinError(ctypes.get_last_error())
-            return args
+    def sync_journal(self):
+        """Writes layout changes since the last sync to the journal"""
+        if self.journal is None:
+            return
+        try:
+            self.journal.sync(self.tilers)
+        except OSError as e:
+            log.error('error writing %s: %s', self.journal.path, e)
 
-        def callback(hWinEventHook, event, hwnd, idObject, idChild, dwEventThread, dwmsEventTime):
-            func = MESSAGE_MAP.get(event)
-            if func is not None:
-                func(hwnd, dwmsEventTime)
+    def handle_win_event(self, event, hwnd, id_object, id_child, dwmsEventTime):
+        """Called by the backend on the hook thread for every hooked event"""
+        # only queue here, handlers run on the event queue's worker
+        if metrics.enabled:
+            metrics.count('hooked.' + event_name(event))
+        if self.recorder is not None:
+            self.recorder.event(event, hwnd, id_object, id_child, dwmsEventTime)
+        if self.event_filter.accept(event, hwnd, id_object, id_child):
+            self.events.put(event, hwnd, id_object, dwmsEventTime)
 
-        self.WinEventProc = WinEventProcType(callback)
+    def handle_config_change(self, data, rules):
+        """Called by the config watcher with a parsed config"""
+        self.events.call(self.apply_config, data, rules, key='config')
 
-        user32.SetWinEventHook.restype = ctypes.wintypes.HANDLE
-        user32.SetWinEventHook.errcheck = win_error
+    def reload_config(self):
+        """Reads config.json now and applies whatever changed"""
+        try:
+            data, rules = config.parse_config()
+        except (OSError, ValueError, KeyError, IndexError, TypeError, re.error) as e:
+            log.error('error reloading config: %s', e)
+            return
+        self.apply_config(data, rules)
 
-        thread = threading.Thread(target=self.msg_loop, args=(user32, ole32))
-        thread.start()
-        return thread.ident
+    @metrics.timed('apply_config', count_calls=True)
+    def apply_config(self, data, rules):
+        """Makes a new config current and re-applies only what changed"""
+        old, old_rules = config.data, config.RULES()
+        config.use_config(data, rules)
+        changed = config.changed_settings(old, data)
+        if not changed:
+            return
+        log.info('config changed: %s', ', '.join(sorted(changed)))
+
+        retile = set()
+        # added, changed and removed rules
+        rule_classes = config.changed_entries(old, data, "Rules")
+        for window in self.registry:
+            if window.classname in rule_classes:
+                window.tiler.apply_rules(window, old_rules.match_window(window).rule)
+                retile.add(window.tiler)
+
+        ignored_classes = config.changed_entries(old, data, "IgnoredClassNames")
+        ignored_titles = config.changed_entries(old, data, "IgnoredWindowTitles")
+        if ignored_classes or ignored_titles:
+            for window in self.registry:
+                if rules.match_window(window).ignored:
+                    retile.add(window.tiler)
+                    window.tiler.remove_window(window)
+            if (set(old.get("IgnoredClassNames", ())) - set(data.get("IgnoredClassNames", ())) or
+                    set(old.get("IgnoredWindowTitles", ())) - set(data.get("IgnoredWindowTitles", ()))):
+                # windows that are no longer ignored
+                self.resync()
+
+        if changed & RELAYOUT_SETTINGS:
+            self.tile_all(relayout=True)
+        else:
+            margin_classes = config.changed_entries(old, data, "SpecialMargins")
+            if margin_classes:
+                for t in self.tilers:
+                    t.retile_windows([w for w in t.windows if w.classname in margin_classes])
+            for t in retile:
+                t.tile_windows()
+
+        if "LogLevel" in changed:
+            set_level(config.LOG_LEVEL())
+        if "Metrics" in changed:
+            if config.METRICS():
+                metrics.enable()
+            else:
+                metrics.disable()
+        if "ResyncInterval" in changed:
+            self.events.set_timer(config.RESYNC_INTERVAL(), self.resync)
+        if "HungWindowTimeout" in changed:
+            guard.timeout = config.HUNG_WINDOW_TIMEOUT() / 1000
+        if "HungRetryInterval" in changed:
+            self.events.set_timer(config.HUNG_RETRY_INTERVAL(), self.retry_hung, key='hung retry')
+        if "JournalInterval" in changed and self.journal is not None:
+            self.events.set_timer(config.JOURNAL_INTERVAL(), self.sync_journal, key='journal')
+        if "ConfigReloadInterval" in changed and self.config_watcher is not None:
+            self.config_watcher.set_interval(config.CONFIG_RELOAD_INTERVAL())
+
+    def handle_display_change(self):
+        """Called by the backend when monitors or work areas change"""
+        if self.recorder is not None:
+            self.recorder.display()
+        self.events.call(self.on_display_change, key='display')
+
+    def msg_loop(self):
+        try:
+            backend.get().run_message_loop(
+                self.hook_ranges, self.handle_win_event, self.handle_display_change)
+        except BackendError as e:
+            log.error('error running message loop: %s', e)
+        self.events.stop()
+        if self.config_watcher is not None:
+            self.config_watcher.stop()
+        if self.recorder is not None:
+            self.recorder.stop()
+        if self.journal is not None:
+            self.journal.close()
+
+    def stop(self):
+        """Ends the message loop started by start()"""
+        backend.get().quit_message_loop(self.thread_id)
+
+    # commands, the way other threads change tilers and windows
+
+    def submit(self, func, *args, key=None):
+        """Runs func(*args) on the event worker and returns a Future of its result
+
+        The worker is the only thread that changes tilers and windows. Calls
+        with a key that are still waiting are coalesced into one run.
+        """
+        return self.events.submit(func, *args, key=key)
+
+    def retile(self, tiler=None, relayout=False):
+        """Retiles one monitor, or all of them"""
+        return self.submit(self.__retile, tiler, relayout, key=('retile', tiler, relayout))
+
+    def __retile(self, tiler, relayout):
+        if tiler is None:
+            self.tile_all(relayout)
+        elif tiler in self.tilers:
+            tiler.tile_windows(relayout=relayout)
+
+    def toggle_floating(self, window):
+        """Floats a tiled window or tiles a floating one"""
+        return self.submit(self.__toggle_floating, window)
+
+    def __toggle_floating(self, window):
+        result = window.set_floating(not window.is_floating())
+        if result and window.tiler is not None:
+            window.tiler.tile_windows()
+        return result
+
+    def refresh(self):
+        """Reloads the config, picks up missed windows and retiles"""
+        return self.submit(self.__refresh, key='refresh')
+
+    def __refresh(self):
+        self.reload_config()
+        self.resync()
+        self.tile_all()
+
+    def restore(self):
+        """Puts every window back where it was before wmpy tiled it"""
+        return self.submit(self.__restore, key='restore')
+
+    def __restore(self):
+        for t in self.tilers:
+            t.restore_positions(t.start_positions)
+        if self.journal is not None:
+            # nothing left to restore after a crash
+            self.events.cancel('journal')
+            self.journal.discard()
+            self.journal = None
+
+    def stats(self):
+        """Returns a Future of the metrics plus queue, cache and tiler stats"""
+        return self.submit(self.__stats, key='stats')
+
+    def __stats(self):
+        stats = metrics.snapshot()
+        stats["startup_ms"] = self.startup.summary()
+        stats["events"] = self.events.stats()
+        stats["filter"] = {event_name(e): v for e, v in self.event_filter.stats().items()}
+        stats["cache"] = window_cache.stats()
+        stats["hung"] = guard.stats()
+        stats["rules"] = config.RULES().stats()
+        if self.journal is not None:
+            stats["journal"] = self.journal.stats()
+        stats["tilers"] = [{
+            "monitor": int(t.monitor.handle),
+            "windows": len(t.windows),
+            "moves_issued": t.moves_issued,
+            "moves_skipped": t.moves_skipped,
+            "placement_ms": t.placement_ms
+        } for t in self.tilers]
+        return stats
+
+    def dump_stats(self, path):
+        """Writes stats() to path as JSON, returns a Future of the path"""
+        return self.submit(self.__dump_stats, path)
 
-    def msg_loop(self, user32, ole32):
-        hook = user32.SetWinEventHook(
-            EVENT_MIN,
-            EVENT_MAX,
-            0,
-            self.WinEventProc,
-            0,
-            0,
-            WINEVENT_OUTOFCONTEXT
-        )
-        if hook == 0:
-            print('SetWinEventHook failed')
-            sys.exit(1)
-
-        msg = ctypes.wintypes.MSG()
-        while user32.GetMessageW(ctypes.byref(msg), 0, 0, 0) != 0:
-            user32.TranslateMessageW(msg)
-            user32.DispatchMessageW(msg)
-
-        user32.UnhookWinEvent(hook)
-        ole32.CoUninitialize()
+    def __dump_stats(self, path):
+        stats = self.__stats()
+        stats["log"] = recent_lines()
+        with open(path, 'w') as f:
+            json.dump(stats, f, indent=4)
+        return path
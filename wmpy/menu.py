@@ -0,0 +1,114 @@
+"""Contains the MenuModel class, the tray menu kept current as windows change"""
+import heapq
+import threading
+
+TITLE_LIMIT = 42
+
+
+def monitor_label(monitor):
+    left, top, right, bottom = monitor.display_resolution
+    return "{width}x{height} Display{primary}".format(
+        width=right - left,
+        height=bottom - top,
+        primary=" [PRIMARY]" if monitor.is_main() else ""
+    )
+
+
+def window_label(title):
+    label = title or ''
+    if len(label) > TITLE_LIMIT:
+        label = label[:TITLE_LIMIT] + '...'
+    return label
+
+
+class MenuEntry(object):
+    def __init__(self, id, window, monitor, label):
+        self.id = id
+        self.window = window
+        # handle of the monitor the window is listed under
+        self.monitor = monitor
+        self.label = label
+
+
+class MenuModel(object):
+    """Monitors and managed windows as the tray menu shows them
+
+    Updated on the event worker whenever a window is added, removed or
+    retitled and whenever monitors change, so opening the menu only copies
+    what is here. A window keeps its id for as long as it is listed and
+    freed ids are handed out again, so ids stay small and the UI can bind
+    one fixed range of them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # monitor handle -> label, in display order
+        self.monitors = {}
+        # hwnd -> MenuEntry, in the order windows were added
+        self.entries = {}
+        self.by_id = {}
+        self.free_ids = []
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __allocate_id(self):
+        if self.free_ids:
+            return heapq.heappop(self.free_ids)
+        self.next_id += 1
+        return self.next_id - 1
+
+    def set_monitors(self, monitors):
+        """Lists the given monitors, dropping any that are gone"""
+        labels = {int(m.handle): monitor_label(m) for m in monitors
+                  if m.display_resolution is not None}
+        with self.lock:
+            self.monitors = labels
+
+    def window_added(self, window):
+        """Lists a window under its tiler's monitor, or moves it there"""
+        monitor = int(window.tiler.monitor.handle)
+        label = window_label(window.display_title)
+        with self.lock:
+            entry = self.entries.get(int(window.handle))
+            if entry is None:
+                entry = MenuEntry(self.__allocate_id(), window, monitor, label)
+                self.entries[int(window.handle)] = entry
+                self.by_id[entry.id] = entry
+            else:
+                entry.window = window
+                entry.monitor = monitor
+                entry.label = label
+
+    def window_removed(self, window):
+        with self.lock:
+            entry = self.entries.get(int(window.handle))
+            if entry is None or entry.window is not window:
+                return
+            del self.entries[int(window.handle)]
+            del self.by_id[entry.id]
+            heapq.heappush(self.free_ids, entry.id)
+
+    def window_retitled(self, window):
+        label = window_label(window.display_title)
+        with self.lock:
+            entry = self.entries.get(int(window.handle))
+            if entry is not None:
+                entry.label = label
+
+    def window(self, id):
+        """Returns the Window listed under id, or None"""
+        with self.lock:
+            entry = self.by_id.get(id)
+            return entry.window if entry is not None else None
+
+    def snapshot(self):
+        """Returns [(monitor label, [(id, label, floating)])] without querying any window"""
+        with self.lock:
+            windows = {handle: [] for handle in self.monitors}
+            for entry in self.entries.values():
+                if entry.monitor in windows:
+                    windows[entry.monitor].append(
+                        (entry.id, entry.label, entry.window.floating))
+            return [(label, windows[handle]) for handle, label in self.monitors.items()]
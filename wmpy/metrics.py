@@ -0,0 +1,244 @@
+"""Contains the Metrics class for counting and timing wmpy's hot paths
+
+    from wmpy.metrics import metrics
+
+    @metrics.timed('tile_windows', count_calls=True)
+    def tile_windows(self): ...
+
+While disabled every instrumented function only checks metrics.enabled and
+the backend is not wrapped at all. Enabled, every backend call is counted
+and timed through InstrumentedBackend.
+"""
+import collections
+import functools
+import math
+import threading
+import time
+
+import wmpy.backend as backend
+
+# histogram buckets grow by 2^(1/4), about 19% per bucket
+BUCKET_BASE = 2 ** 0.25
+LOG_BASE = math.log(BUCKET_BASE)
+
+# backend calls that block for the lifetime of the manager
+UNTIMED_CALLS = frozenset(('run_message_loop', 'quit_message_loop'))
+
+
+class Histogram(object):
+    """Log-bucketed histogram of positive values, e.g. microseconds"""
+
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        index = int(math.log(value) / LOG_BASE) if value > 1 else 0
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """Returns the upper bound of the bucket holding the percentile"""
+        if self.count == 0:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(BUCKET_BASE ** (index + 1), self.max)
+        return self.max
+
+    def summary(self, scale=1.0):
+        """Returns count, mean, p50, p99 and max, values divided by scale"""
+        return {
+            "count": self.count,
+            "mean": self.total / self.count / scale if self.count else 0.0,
+            "p50": self.percentile(0.5) / scale,
+            "p99": self.percentile(0.99) / scale,
+            "max": self.max / scale
+        }
+
+
+class PhaseTimer(object):
+    """Wall time of consecutive named steps, e.g. the startup breakdown"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = self.last = clock()
+        # name -> milliseconds
+        self.phases = collections.OrderedDict()
+
+    def mark(self, name):
+        """Ends the step called name, the next one starts now"""
+        now = self.clock()
+        self.phases[name] = self.phases.get(name, 0.0) + (now - self.last) * 1000
+        self.last = now
+
+    def total(self):
+        return sum(self.phases.values())
+
+    def summary(self):
+        summary = collections.OrderedDict(self.phases)
+        summary["total"] = self.total()
+        return summary
+
+    def __str__(self):
+        return ', '.join('{0} {1:.1f} ms'.format(name, ms)
+                         for name, ms in self.summary().items())
+
+
+class InstrumentedBackend(object):
+    """Wraps a Backend, counting and timing every call made through it"""
+
+    def __init__(self, inner, metrics):
+        self.inner = inner
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self.inner, name)
+        if not callable(attr) or name.startswith('_') or name in UNTIMED_CALLS:
+            return attr
+        record = self.metrics.record_call
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        call.__name__ = name
+        # found by normal lookup from now on
+        setattr(self, name, call)
+        return call
+
+
+class Metrics(object):
+    """Counters and latency histograms, kept only while enabled"""
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = collections.Counter()
+            # durations in microseconds
+            self.histograms = collections.defaultdict(Histogram)
+            # plain counts, e.g. backend calls per retile
+            self.distributions = collections.defaultdict(Histogram)
+            self.calls = collections.Counter()
+            self.started = time.monotonic()
+
+    def enable(self):
+        """Starts collecting and instruments the active backend"""
+        if not self.enabled:
+            backend.use(InstrumentedBackend(backend.get(), self))
+            self.enabled = True
+
+    def disable(self):
+        if self.enabled:
+            self.enabled = False
+            current = backend.get()
+            if isinstance(current, InstrumentedBackend):
+                backend.use(current.inner)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += n
+
+    def observe(self, name, seconds):
+        if self.enabled:
+            with self.lock:
+                self.histograms[name].record(seconds * 1e6)
+
+    def record_call(self, name, seconds):
+        self.local.calls = getattr(self.local, 'calls', 0) + 1
+        with self.lock:
+            self.calls[name] += 1
+            self.histograms['backend.' + name].record(seconds * 1e6)
+
+    def thread_calls(self):
+        """Returns the number of backend calls made so far on this thread"""
+        return getattr(self.local, 'calls', 0)
+
+    def add_thread_calls(self, n):
+        """Counts n backend calls made on another thread for this one"""
+        if n:
+            self.local.calls = self.thread_calls() + n
+
+    def timed(self, name, count_calls=False):
+        """Decorator recording the latency of every call under name
+
+        With count_calls, the number of backend calls made during each call
+        is recorded too, under name + '.calls'.
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                calls = self.thread_calls()
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    with self.lock:
+                        self.counters[name] += 1
+                        self.histograms[name].record(elapsed * 1e6)
+                        if count_calls:
+                            self.distributions[name + '.calls'].record(
+                                self.thread_calls() - calls)
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "uptime_s": time.monotonic() - self.started,
+                "counters": dict(sorted(self.counters.items())),
+                "backend_calls": dict(sorted(self.calls.items())),
+                # in milliseconds
+                "latency_ms": {name: h.summary(1000.0)
+                               for name, h in sorted(self.histograms.items())},
+                "distributions": {name: h.summary()
+                                  for name, h in sorted(self.distributions.items())}
+            }
+
+
+metrics = Metrics()
+
+
+def format_stats(stats):
+    """Returns a short plain text report of WindowManager.stats()"""
+    lines = []
+    if not stats["enabled"]:
+        lines.append('Metrics are disabled, set "Metrics": true in config.json')
+    lines.append('{0} backend calls in {1:.0f}s'.format(
+        sum(stats["backend_calls"].values()), stats["uptime_s"]))
+    for name, summary in stats["latency_ms"].items():
+        if not name.startswith('backend.'):
+            lines.append('{0}: {1} x, p50 {2:.2f} ms, p99 {3:.2f} ms, max {4:.2f} ms'.format(
+                name, summary["count"], summary["p50"], summary["p99"], summary["max"]))
+    for name, summary in stats["distributions"].items():
+        lines.append('{0}: {1:.1f} avg, {2:.0f} max'.format(
+            name, summary["mean"], summary["max"]))
+    startup = stats.get("startup_ms")
+    if startup:
+        lines.append('startup: ' + ', '.join('{0} {1:.1f} ms'.format(name, ms)
+                                             for name, ms in startup.items()))
+    events = stats.get("events")
+    if events:
+        lines.append('queue: {0} received, {1:.0%} coalesced, {2} waiting'.format(
+            events["received"], events["coalescing_ratio"], events["depth"]))
+    return '\n'.join(lines)
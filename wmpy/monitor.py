@@ -1,16 +1,28 @@
 """Contains the Monitor class to track physical monitors"""
-import win32api
+import collections
 
-from win32con import MONITOR_DEFAULTTOPRIMARY
-from win32con import MONITOR_DEFAULTTONEAREST
+from wmpy.constants import MONITORINFOF_PRIMARY
+
+from wmpy.backend import BackendError
+import wmpy.backend as backend
+from wmpy.log import get_logger
+from wmpy.snapshot import DesktopSnapshot
+
+log = get_logger(__name__)
+
+# version increases every time the monitor's geometry changes, so tilers can
+# tell whether a relayout is needed by comparing a single integer
+MonitorGeometry = collections.namedtuple(
+    'MonitorGeometry', 'work resolution primary version')
 
-from wmpy.window import Window
 
 class Monitor(object):
     """Maps to a physical monitor"""
 
     def __init__(self, handle):
         self.handle = handle
+        self.geometry = None
+        self.refresh()
 
     def __eq__(self, other):
         return int(self.handle) == int(other.handle)
@@ -29,60 +41,69 @@ class Monitor(object):
             main=" [PRIMARY]" if self.is_main() else ""
         )
 
+    def refresh(self):
+        """Re-reads the monitor info, returns True if the geometry changed"""
+        try:
+            info = backend.get().get_monitor_info(self.handle)
+        except BackendError:
+            log.warning("error while grabbing monitor info of %s", self.handle)
+            return False
+        work = tuple(info["Work"])
+        resolution = tuple(info["Monitor"])
+        primary = bool(info["Flags"] & MONITORINFOF_PRIMARY)
+        if self.geometry is None:
+            self.geometry = MonitorGeometry(work, resolution, primary, 0)
+            return True
+        if self.geometry[:3] == (work, resolution, primary):
+            return False
+        self.geometry = MonitorGeometry(
+            work, resolution, primary, self.geometry.version + 1)
+        return True
+
     def is_main(self):
         """Returns True if this is the primary monitor"""
-        try:
-            if self.handle == win32api.MonitorFromPoint((0, 0), MONITOR_DEFAULTTOPRIMARY):
-                return True
-            else:
-                return False
-        except win32api.error:
-            print("Error while grabbing the monitor with point (0, 0)")
+        if self.geometry is None:
             return None
+        return self.geometry.primary
 
     def contains_window(self, window):
         """Returns True is the window is in this monitor"""
         try:
-            if win32api.MonitorFromWindow(window.handle, MONITOR_DEFAULTTONEAREST) == self.handle:
+            if backend.get().monitor_from_window(window.handle) == self.handle:
                 return True
             else:
                 return False
-        except win32api.error:
-            print("Error grabbing nearest monitor from window")
+        except BackendError:
+            log.warning("error grabbing nearest monitor of window %s", window.handle)
             return None
 
-    def get_window_positions(self):
+    def get_window_positions(self, snapshot=None):
         """Returns a dictionary of Window: display size"""
-        positions = {}
-        for window in Window.get_windows_from_monitor(self):
-            positions[window] = window.display_size
-        return positions
+        if snapshot is None:
+            snapshot = DesktopSnapshot.capture([self])
+        return snapshot.window_positions(self)
 
     @property
     def display_size(self):
-        """Returns the display size of this monitor"""
-        try:
-            return win32api.GetMonitorInfo(self.handle)["Work"]
-        except win32api.error:
-            print("error while grabbing monitor work area")
+        """Returns the work area of this monitor"""
+        if self.geometry is None:
             return None
+        return self.geometry.work
 
     @property
     def display_resolution(self):
-        try:
-            return win32api.GetMonitorInfo(self.handle)["Monitor"]
-        except win32api.error:
-            print("error while grabbing monitor display resolution")
+        if self.geometry is None:
             return None
+        return self.geometry.resolution
 
     @staticmethod
     def get_displays():
         """Returns all physical monitors"""
         monitors = []
         try:
-            for handle, _, _ in win32api.EnumDisplayMonitors():
+            for handle in backend.get().enum_monitors():
                 monitors.append(Monitor(handle))
             return monitors
-        except win32api.error:
-            print("Error while enumerating display monitors")
+        except BackendError:
+            log.error("error while enumerating display monitors")
             return None
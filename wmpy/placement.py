@@ -0,0 +1,145 @@
+"""Contains the Placement class for moving several windows in one batch"""
+import time
+
+from wmpy.constants import SWP_ASYNCWINDOWPOS
+from wmpy.constants import SWP_NOACTIVATE
+from wmpy.constants import SWP_NOZORDER
+
+from wmpy.backend import BackendError
+import wmpy.backend as backend
+from wmpy.cache import window_cache
+from wmpy.guard import guard, WindowTimeout
+
+TILE_FLAGS = SWP_NOZORDER | SWP_NOACTIVATE
+
+
+class Placement(object):
+    """Collects window moves and commits them as a single batch
+
+    Usable as begin()/add()/commit() or as a context manager that commits on
+    exit, or split into send() and finish() to run several batches at
+    once. If the batch cannot be applied atomically every window is moved
+    on its own instead. Hung windows are left out of the batch and only
+    sent their move, they end up in deferred like the windows of a batch
+    that timed out.
+    """
+
+    def __init__(self, desktop=None):
+        # defaults to the active backend
+        self.desktop = desktop
+        self.entries = []
+        self.failed = []
+        # not known to be moved, to be retried
+        self.deferred = []
+        # set by send() until finish()
+        self.sent = []
+        self.ready = []
+        self.pending = None
+        self.started = None
+        # from send() until the moves were applied
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def begin(self):
+        self.entries = []
+        self.failed = []
+        self.deferred = []
+
+    def add(self, window, rect, insert_after=None, flags=TILE_FLAGS):
+        """Queues a move of window to rect (left, top, right, bottom)
+
+        Pass insert_after (e.g. HWND_NOTOPMOST) to change the z-order in the
+        same operation, SWP_NOZORDER is dropped from flags when it is given.
+        """
+        if insert_after is None:
+            insert_after = 0
+        else:
+            flags &= ~SWP_NOZORDER
+        self.entries.append((window, insert_after, tuple(rect), flags))
+
+    def commit(self):
+        """Applies all queued moves, returns True if none failed"""
+        self.send()
+        return self.finish()
+
+    def send(self):
+        """Starts applying the queued moves without waiting for them
+
+        finish() waits and handles what did not work, so batches of several
+        placements can be sent first and run at the same time.
+        """
+        entries, self.entries = self.entries, []
+        self.sent = entries
+        self.ready = []
+        self.pending = None
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        if not entries:
+            return
+        desktop = self.desktop or backend.get()
+        for entry in entries:
+            if guard.is_hung(entry[0].handle):
+                self.__post(desktop, *entry)
+            else:
+                self.ready.append(entry)
+        if self.ready:
+            batch = [(w.handle, after, rect, flags)
+                     for w, after, rect, flags in self.ready]
+            try:
+                self.pending = guard.submit([w.handle for w, _, _, _ in self.ready],
+                                            desktop.apply_window_positions, batch)
+            except WindowTimeout:
+                for entry in self.ready:
+                    self.__post(desktop, *entry)
+
+    def finish(self):
+        """Waits for the moves sent by send(), returns True if none failed"""
+        entries, ready, pending = self.sent, self.ready, self.pending
+        self.sent, self.ready, self.pending = [], [], None
+        if not entries:
+            return True
+        desktop = self.desktop or backend.get()
+        applied = True
+        if pending is not None:
+            try:
+                applied = pending.result()
+            except WindowTimeout:
+                # an app in the batch hangs, send every move on its own without
+                # waiting, the stuck batch may still land later so all are retried
+                for entry in ready:
+                    self.__post(desktop, *entry)
+        if not applied:
+            for window, after, rect, flags in ready:
+                try:
+                    guard.call([window.handle], desktop.set_window_pos,
+                               window.handle, after, rect, flags)
+                except WindowTimeout:
+                    guard.defer(window.handle)
+                    self.deferred.append(window)
+                except BackendError:
+                    self.failed.append(window)
+        for window, _, _, _ in entries:
+            window_cache.forget(window.handle, ('rect', 'exstyle'))
+        if applied and pending is not None and pending.finished is not None:
+            self.seconds = pending.finished - self.started
+        else:
+            self.seconds = time.perf_counter() - self.started
+        return not self.failed
+
+    def __post(self, desktop, window, insert_after, rect, flags):
+        try:
+            desktop.set_window_pos(window.handle, insert_after, rect, flags | SWP_ASYNCWINDOWPOS)
+            guard.defer(window.handle, posted=True)
+            self.deferred.append(window)
+        except BackendError:
+            self.failed.append(window)
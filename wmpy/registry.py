@@ -0,0 +1,45 @@
+"""Contains the WindowRegistry class for looking up managed windows by handle"""
+
+
+class WindowRegistry(object):
+    """hwnd -> Window for every window managed by any tiler
+
+    The owning Tiler is window.tiler, so finding a window and its tiler from
+    an event is a single dictionary lookup however many windows are open.
+    The registry is read from the hook thread, every update is a single
+    dictionary operation. An observer, e.g. the tray's MenuModel, is told
+    about every window added and removed.
+    """
+
+    def __init__(self, observer=None):
+        self.windows = {}
+        self.observer = observer
+
+    def __len__(self):
+        return len(self.windows)
+
+    def __contains__(self, hwnd):
+        return int(hwnd) in self.windows
+
+    def __iter__(self):
+        return iter(list(self.windows.values()))
+
+    def get(self, hwnd):
+        """Returns the managed Window for hwnd, or None"""
+        return self.windows.get(int(hwnd))
+
+    def tiler_of(self, hwnd):
+        window = self.windows.get(int(hwnd))
+        return window.tiler if window is not None else None
+
+    def add(self, window):
+        self.windows[int(window.handle)] = window
+        if self.observer is not None:
+            self.observer.window_added(window)
+
+    def remove(self, window):
+        """Forgets window, unless the handle was registered again since"""
+        if self.windows.get(int(window.handle)) is window:
+            del self.windows[int(window.handle)]
+            if self.observer is not None:
+                self.observer.window_removed(window)
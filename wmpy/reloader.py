@@ -0,0 +1,73 @@
+"""Contains the ConfigWatcher class for reloading config.json when it changes"""
+import os
+import re
+import threading
+
+import wmpy.config as config
+from wmpy.log import get_logger
+
+log = get_logger(__name__)
+
+
+class ConfigWatcher(object):
+    """Polls the config file's mtime and parses it on its own thread
+
+    on_change(data, rules) gets the parsed config, making it current is up
+    to the caller. A file that fails to parse, e.g. while it is being saved,
+    is reported and retried on its next change.
+    """
+
+    def __init__(self, on_change, interval, path=None):
+        self.on_change = on_change
+        self.interval = interval
+        self.path = path or config.config_path()
+        self.mtime = self.__mtime()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def start(self):
+        if not self.interval or self.interval <= 0 or self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def set_interval(self, interval):
+        """Changes how often the file is polled, 0 stops polling until it is set again"""
+        self.interval = interval
+        if not interval or interval <= 0:
+            self.stop()
+        else:
+            # picked up by a running thread on its next wait
+            self.start()
+
+    def run(self):
+        # wait(0) would poll the file as fast as it can
+        while self.interval and self.interval > 0 and not self.stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Parses and hands over the config if the file changed, returns True if it did"""
+        mtime = self.__mtime()
+        if mtime is None or mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        try:
+            data, rules = config.parse_config(self.path)
+        except (OSError, ValueError, KeyError, IndexError, TypeError, re.error) as e:
+            log.error('error reloading %s: %s', self.path, e)
+            return False
+        self.on_change(data, rules)
+        return True
@@ -0,0 +1,84 @@
+"""Contains the RuleSet class, config rules compiled for fast window matching"""
+import collections
+import re
+
+WindowRules = collections.namedtuple('WindowRules', 'ignored rule special_margin')
+
+NO_RULES = WindowRules(False, None, None)
+
+# distinct (classname, title) decisions kept before starting over
+MEMO_LIMIT = 4096
+
+
+class RuleSet(object):
+    """Rules, SpecialMargins and ignore lists of one loaded config
+
+    Regexes are compiled once and bucketed by classname, and the decision
+    for each (classname, title) is memoized. A title change gives a new key,
+    a config reload builds a new RuleSet.
+    """
+
+    def __init__(self, data):
+        self.ignored_classnames = frozenset(data.get("IgnoredClassNames", ()))
+        self.ignored_titles = frozenset(data.get("IgnoredWindowTitles", ()))
+        # classname -> [(regex, rule)] in config order, the first match wins
+        self.rules = collections.defaultdict(list)
+        for classname, rule in data.get("Rules", {}).items():
+            for r in rule if isinstance(rule, list) else [rule]:
+                self.rules[classname].append((re.compile(r["regex"]), r))
+        # classname -> [(regex, margin)]
+        self.special_margins = collections.defaultdict(list)
+        for classname, margin in data.get("SpecialMargins", {}).items():
+            self.special_margins[classname].append(
+                (re.compile(margin[0]), tuple(margin[1])))
+        self.memo = {}
+        self.hits = 0
+        self.misses = 0
+
+    def match(self, classname, title):
+        """Returns the WindowRules that apply to a window"""
+        key = (classname, title)
+        result = self.memo.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = self.__evaluate(classname, title or '')
+        if len(self.memo) >= MEMO_LIMIT:
+            self.memo.clear()
+        self.memo[key] = result
+        return result
+
+    def match_window(self, window):
+        """Returns the WindowRules for a Window, reading its title only if needed"""
+        classname = window.classname
+        if classname in self.ignored_classnames:
+            return self.match(classname, None)
+        if not self.ignored_titles and classname not in self.rules and classname not in self.special_margins:
+            return NO_RULES
+        return self.match(classname, window.title)
+
+    def __evaluate(self, classname, title):
+        if classname in self.ignored_classnames or title in self.ignored_titles:
+            return WindowRules(True, None, None)
+        if classname not in self.rules and classname not in self.special_margins:
+            return NO_RULES
+        rule = None
+        for regex, r in self.rules.get(classname, ()):
+            if regex.search(title) is not None:
+                rule = r
+                break
+        special_margin = None
+        for regex, margin in self.special_margins.get(classname, ()):
+            if regex.search(title) is not None:
+                special_margin = margin
+                break
+        return WindowRules(False, rule, special_margin)
+
+    def stats(self):
+        return {
+            "rules": sum(len(r) for r in self.rules.values()),
+            "memoized": len(self.memo),
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,94 @@
+"""Contains the Scheduler class for delayed, debounced and repeating calls"""
+import heapq
+import itertools
+import time
+
+
+class ScheduledCall(object):
+    def __init__(self, due, func, args, key, interval):
+        self.due = due
+        self.func = func
+        self.args = args
+        self.key = key
+        # seconds between runs of a repeating call, None runs once
+        self.interval = interval
+        self.cancelled = False
+
+
+class Scheduler(object):
+    """A heap of calls ordered by due time
+
+    Nothing runs on its own: the owner asks next_due() how long it may
+    sleep and calls pop_due() when woken. Calls with a key replace any
+    pending call with the same key. Cancelled calls stay in the heap until
+    they come up and are skipped then. Not thread-safe, EventQueue guards it
+    with its own lock.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.keys = {}
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __push(self, call):
+        if call.key is not None:
+            previous = self.keys.get(call.key)
+            if previous is not None:
+                previous.cancelled = True
+            self.keys[call.key] = call
+        heapq.heappush(self.heap, (call.due, next(self.counter), call))
+        return call
+
+    def call_later(self, delay, func, *args, key=None):
+        """Runs func(*args) once after delay seconds
+
+        A pending call with the same key is replaced, which debounces it.
+        """
+        return self.__push(ScheduledCall(self.clock() + delay, func, args, key, None))
+
+    def every(self, interval, func, *args, key=None):
+        """Runs func(*args) every interval seconds, the first time after one interval"""
+        return self.__push(ScheduledCall(self.clock() + interval, func, args, key, interval))
+
+    def is_scheduled(self, key):
+        return key in self.keys
+
+    def remaining(self, key):
+        """Returns the seconds until the call with key is due, or None"""
+        call = self.keys.get(key)
+        if call is None:
+            return None
+        return max(call.due - self.clock(), 0)
+
+    def cancel(self, key):
+        call = self.keys.pop(key, None)
+        if call is not None:
+            call.cancelled = True
+
+    def next_due(self):
+        """Returns the seconds until the next call is due, None if there is none"""
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        return max(self.heap[0][0] - self.clock(), 0)
+
+    def pop_due(self):
+        """Removes and returns the calls that are due, rescheduling repeating ones"""
+        now = self.clock()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, _, call = heapq.heappop(self.heap)
+            if call.cancelled:
+                continue
+            due.append(call)
+            if call.interval is not None:
+                call.due = now + call.interval
+                heapq.heappush(self.heap, (call.due, next(self.counter), call))
+            elif call.key is not None:
+                del self.keys[call.key]
+        return due
@@ -0,0 +1,368 @@
+"""Contains SimulatedDesktop, an in-memory Backend for running wmpy anywhere
+
+    import wmpy.backend as backend
+    from wmpy.simulated import SimulatedDesktop
+
+    desktop = backend.use(SimulatedDesktop().populate(2, 20))
+    wm = WindowManager()
+
+Every backend call is counted in desktop.calls and can be slowed down with
+latency (seconds, either one value or a dict per call name) to model a busy
+desktop, answer_time models apps that are slow to handle their moves.
+Helpers like move_window_by_user deliver the events a real desktop would.
+"""
+import collections
+import threading
+import time
+
+from wmpy.backend import Backend, BackendError
+from wmpy.constants import CHILDID_SELF
+from wmpy.constants import EVENT_OBJECT_CREATE
+from wmpy.constants import EVENT_OBJECT_DESTROY
+from wmpy.constants import EVENT_OBJECT_HIDE
+from wmpy.constants import EVENT_OBJECT_LOCATIONCHANGE
+from wmpy.constants import EVENT_OBJECT_NAMECHANGE
+from wmpy.constants import EVENT_OBJECT_SHOW
+from wmpy.constants import EVENT_SYSTEM_MINIMIZEEND
+from wmpy.constants import EVENT_SYSTEM_MINIMIZESTART
+from wmpy.constants import GWL_EXSTYLE
+from wmpy.constants import HWND_NOTOPMOST
+from wmpy.constants import HWND_TOPMOST
+from wmpy.constants import MONITORINFOF_PRIMARY
+from wmpy.constants import OBJID_WINDOW
+from wmpy.constants import SWP_ASYNCWINDOWPOS
+from wmpy.constants import SWP_NOMOVE
+from wmpy.constants import SWP_NOSIZE
+from wmpy.constants import SWP_NOZORDER
+from wmpy.constants import WS_EX_TOPMOST
+from wmpy.constants import WS_MINIMIZE
+from wmpy.constants import WS_OVERLAPPEDWINDOW
+from wmpy.constants import WS_VISIBLE
+
+TILEABLE_STYLE = WS_OVERLAPPEDWINDOW | WS_VISIBLE
+
+
+def overlap(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    return max(width, 0) * max(height, 0)
+
+
+def simulated_call(func):
+    """Counts the call and applies the configured latency"""
+    name = func.__name__
+
+    def wrapper(self, *args, **kwargs):
+        self.calls[name] += 1
+        latency = self.latency.get(name, 0) if isinstance(self.latency, dict) else self.latency
+        if latency:
+            time.sleep(latency)
+        return func(self, *args, **kwargs)
+    wrapper.__name__ = name
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+class SimulatedWindow(object):
+    def __init__(self, rect, title, classname, style, exstyle, visible, iconic):
+        self.rect = tuple(rect)
+        self.title = title
+        self.classname = classname
+        self.style = style
+        self.exstyle = exstyle
+        self.visible = visible
+        self.iconic = iconic
+        # a hung app blocks calls sending it messages, posted ones wait
+        self.hung = False
+        self.posted = []
+
+
+class SimulatedMonitor(object):
+    def __init__(self, rect, work, primary):
+        self.rect = tuple(rect)
+        self.work = tuple(work)
+        self.primary = primary
+
+
+class SimulatedDesktop(Backend):
+    """Monitors and top-level windows kept in memory"""
+
+    def __init__(self, latency=0):
+        self.monitors = collections.OrderedDict()
+        self.windows = collections.OrderedDict()
+        self.calls = collections.Counter()
+        self.latency = latency
+        # every placement batch applied, as lists of (hwnd, rect)
+        self.batches = []
+        self.next_monitor = 0x10000
+        self.next_window = 0x20000
+        self.on_event = None
+        self.on_display_change = None
+        self.quit = threading.Event()
+        # seconds a call blocks on a hung window
+        self.hang_time = 1.0
+        # seconds every window's app takes to answer a move or restyle, a
+        # batch waits for each of its windows in turn
+        self.answer_time = 0
+        self.start_time = time.monotonic()
+        # event timestamps in ms, follows the real clock until advance()
+        self.clock = None
+
+    # building the desktop
+
+    def add_monitor(self, rect, taskbar=40, primary=None):
+        self.next_monitor += 1
+        left, top, right, bottom = rect
+        if primary is None:
+            primary = not self.monitors
+        self.monitors[self.next_monitor] = SimulatedMonitor(
+            rect, (left, top, right, bottom - taskbar), primary)
+        return self.next_monitor
+
+    def add_window(self, rect, title='window', classname='Window',
+                   style=TILEABLE_STYLE, exstyle=0, visible=True, iconic=False):
+        self.next_window += 4
+        self.windows[self.next_window] = SimulatedWindow(
+            rect, title, classname, style, exstyle, visible, iconic)
+        return self.next_window
+
+    def populate(self, monitors, windows_per_monitor, hidden_per_monitor=0,
+                 width=1920, height=1080):
+        """Creates a row of monitors, each with cascaded and hidden windows"""
+        for i in range(monitors):
+            self.add_monitor((i * width, 0, (i + 1) * width, height))
+        for i in range(monitors):
+            for j in range(windows_per_monitor):
+                offset = (j * 17) % (height // 2)
+                left = i * width + offset
+                self.add_window((left, offset, left + width // 2, offset + height // 2),
+                                title='window {0}-{1}'.format(i, j),
+                                classname='Window{0}'.format(j % 5))
+            for j in range(hidden_per_monitor):
+                self.add_window((i * width, 0, i * width + 10, 10),
+                                title='hidden', classname='Hidden', visible=False)
+        return self
+
+    def reset_calls(self):
+        self.calls.clear()
+        self.batches = []
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def window(self, hwnd):
+        try:
+            return self.windows[hwnd]
+        except KeyError:
+            raise BackendError(1400, 'Invalid window handle')
+
+    def monitor_from_rect(self, rect):
+        return max(self.monitors, key=lambda h: overlap(self.monitors[h].rect, rect))
+
+    # driving the desktop like a user would
+
+    def emit(self, event, hwnd, id_object=OBJID_WINDOW, id_child=CHILDID_SELF):
+        """Delivers an event to the running message loop, if any"""
+        if self.on_event is not None:
+            self.on_event(event, hwnd, id_object, id_child, self.tick_count())
+
+    def create_window(self, rect, **kwargs):
+        hwnd = self.add_window(rect, **kwargs)
+        self.emit(EVENT_OBJECT_CREATE, hwnd)
+        if self.windows[hwnd].visible:
+            self.emit(EVENT_OBJECT_SHOW, hwnd)
+        return hwnd
+
+    def destroy_window(self, hwnd):
+        window = self.windows.pop(hwnd)
+        if window.visible:
+            self.emit(EVENT_OBJECT_HIDE, hwnd)
+        self.emit(EVENT_OBJECT_DESTROY, hwnd)
+
+    def move_window_by_user(self, hwnd, rect):
+        self.windows[hwnd].rect = tuple(rect)
+        self.emit(EVENT_OBJECT_LOCATIONCHANGE, hwnd)
+
+    def set_title(self, hwnd, title):
+        self.windows[hwnd].title = title
+        self.emit(EVENT_OBJECT_NAMECHANGE, hwnd)
+
+    def minimize(self, hwnd, iconic=True):
+        self.windows[hwnd].iconic = iconic
+        self.emit(EVENT_SYSTEM_MINIMIZESTART if iconic else EVENT_SYSTEM_MINIMIZEEND, hwnd)
+
+    def hang(self, hwnd, hung=True):
+        """Makes a window's app stop answering, or answer again and apply posted moves"""
+        window = self.windows[hwnd]
+        window.hung = hung
+        if not hung:
+            posted, window.posted = window.posted, []
+            for insert_after, rect, flags in posted:
+                self.__set_window_pos(hwnd, insert_after, rect, flags)
+
+    def __block_on(self, hwnds):
+        delay = self.answer_time * len(hwnds)
+        if any(hwnd in self.windows and self.windows[hwnd].hung for hwnd in hwnds):
+            delay += self.hang_time
+        if delay:
+            time.sleep(delay)
+
+    def change_work_area(self, handle, work):
+        self.monitors[handle].work = tuple(work)
+        if self.on_display_change is not None:
+            self.on_display_change()
+
+    # windows
+
+    @simulated_call
+    def enum_windows(self):
+        return list(self.windows)
+
+    @simulated_call
+    def is_window(self, hwnd):
+        return hwnd in self.windows
+
+    @simulated_call
+    def is_window_visible(self, hwnd):
+        return hwnd in self.windows and self.windows[hwnd].visible
+
+    @simulated_call
+    def is_iconic(self, hwnd):
+        return hwnd in self.windows and self.windows[hwnd].iconic
+
+    @simulated_call
+    def get_window_rect(self, hwnd):
+        return self.window(hwnd).rect
+
+    @simulated_call
+    def get_window_text(self, hwnd):
+        return self.window(hwnd).title
+
+    @simulated_call
+    def get_class_name(self, hwnd):
+        return self.window(hwnd).classname
+
+    @simulated_call
+    def get_window_long(self, hwnd, index):
+        window = self.window(hwnd)
+        if index == GWL_EXSTYLE:
+            return window.exstyle
+        # like Win32, where IsIconic tests this bit
+        return window.style | WS_MINIMIZE if window.iconic else window.style
+
+    @simulated_call
+    def set_window_long(self, hwnd, index, value):
+        window = self.window(hwnd)
+        self.__block_on([hwnd])
+        if index == GWL_EXSTYLE:
+            previous, window.exstyle = window.exstyle, value
+        else:
+            previous, window.style = window.style, value & ~WS_MINIMIZE
+        return previous
+
+    @simulated_call
+    def move_window(self, hwnd, rect):
+        self.__block_on([hwnd])
+        self.window(hwnd).rect = tuple(rect)
+        self.batches.append([(hwnd, tuple(rect))])
+
+    @simulated_call
+    def set_window_pos(self, hwnd, insert_after, rect, flags):
+        window = self.window(hwnd)
+        if flags & SWP_ASYNCWINDOWPOS and window.hung:
+            window.posted.append((insert_after, rect, flags))
+            return
+        if not flags & SWP_ASYNCWINDOWPOS:
+            self.__block_on([hwnd])
+        self.__set_window_pos(hwnd, insert_after, rect, flags)
+        if not flags & (SWP_NOMOVE | SWP_NOSIZE):
+            self.batches.append([(hwnd, tuple(rect))])
+
+    @simulated_call
+    def apply_window_positions(self, entries):
+        if any(hwnd not in self.windows for hwnd, _, _, _ in entries):
+            return False
+        self.__block_on([hwnd for hwnd, _, _, _ in entries])
+        for hwnd, insert_after, rect, flags in entries:
+            self.__set_window_pos(hwnd, insert_after, rect, flags)
+        self.batches.append([(hwnd, tuple(rect)) for hwnd, _, rect, _ in entries])
+        return True
+
+    def __set_window_pos(self, hwnd, insert_after, rect, flags):
+        window = self.window(hwnd)
+        if not flags & (SWP_NOMOVE | SWP_NOSIZE):
+            window.rect = tuple(rect)
+        if not flags & SWP_NOZORDER:
+            if insert_after == HWND_TOPMOST:
+                window.exstyle |= WS_EX_TOPMOST
+            elif insert_after == HWND_NOTOPMOST:
+                window.exstyle &= ~WS_EX_TOPMOST
+
+    @simulated_call
+    def is_hung(self, hwnd):
+        return self.window(hwnd).hung
+
+    @simulated_call
+    def release_mouse_button(self):
+        pass
+
+    # monitors
+
+    @simulated_call
+    def enum_monitors(self):
+        return list(self.monitors)
+
+    @simulated_call
+    def get_monitor_info(self, handle):
+        try:
+            monitor = self.monitors[handle]
+        except KeyError:
+            raise BackendError(0, 'Invalid monitor handle')
+        return {
+            "Monitor": monitor.rect,
+            "Work": monitor.work,
+            "Flags": MONITORINFOF_PRIMARY if monitor.primary else 0
+        }
+
+    @simulated_call
+    def monitor_from_window(self, hwnd):
+        return self.monitor_from_rect(self.window(hwnd).rect)
+
+    # events
+
+    def advance(self, ms):
+        """Moves event timestamps forward without waiting"""
+        if self.clock is None:
+            self.clock = self.tick_count()
+        self.clock += ms
+
+    def tick_count(self):
+        if self.clock is not None:
+            return self.clock & 0xFFFFFFFF
+        return int((time.monotonic() - self.start_time) * 1000) & 0xFFFFFFFF
+
+    def monotonic(self):
+        """Seconds on the event clock, a scheduler clock that follows advance()"""
+        return self.tick_count() / 1000
+
+    def attach(self, hook_ranges, on_event, on_display_change):
+        """Delivers events like run_message_loop, without blocking
+
+        Events are then handled on the thread that emits them.
+        """
+        def hooked(event, hwnd, id_object, id_child, dwmsEventTime):
+            if any(low <= event <= high for low, high in hook_ranges):
+                on_event(event, hwnd, id_object, id_child, dwmsEventTime)
+
+        self.on_event = hooked
+        self.on_display_change = on_display_change
+
+    def run_message_loop(self, hook_ranges, on_event, on_display_change):
+        self.quit.clear()
+        self.attach(hook_ranges, on_event, on_display_change)
+        self.quit.wait()
+        self.on_event = None
+        self.on_display_change = None
+
+    def quit_message_loop(self, thread_id):
+        self.quit.set()
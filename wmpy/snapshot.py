@@ -0,0 +1,102 @@
+"""Contains the DesktopSnapshot class for enumerating the desktop in one pass"""
+import collections
+
+from wmpy.constants import GWL_STYLE
+from wmpy.constants import WS_MINIMIZE
+
+from wmpy.backend import BackendError
+import wmpy.backend as backend
+
+from wmpy.cache import window_cache
+from wmpy.window import Window, should_manage_style
+
+WindowInfo = collections.namedtuple(
+    'WindowInfo', 'handle rect style exstyle visible iconic monitor')
+
+
+def locate(rect, monitor_rects):
+    """Returns the handle of the monitor rect overlaps most, like MonitorFromWindow"""
+    best = None
+    best_area = 0
+    for handle, (left, top, right, bottom) in monitor_rects:
+        width = min(rect[2], right) - max(rect[0], left)
+        height = min(rect[3], bottom) - max(rect[1], top)
+        if width > 0 and height > 0 and width * height > best_area:
+            best = handle
+            best_area = width * height
+    return best
+
+
+class DesktopSnapshot(object):
+    """State of every top-level window, partitioned by monitor
+
+    A single EnumWindows walks the desktop and each window is queried once;
+    hidden and minimized windows stop being queried as soon as that is known.
+    Extended styles are not needed to tile and are left to the window cache.
+    """
+
+    def __init__(self, windows):
+        self.windows = windows
+        self.by_monitor = collections.defaultdict(list)
+        for info in windows:
+            if info.monitor is not None:
+                self.by_monitor[int(info.monitor)].append(info)
+
+    def manageable(self, monitor):
+        """Returns WindowInfo for windows on the monitor that can be tiled"""
+        return [info for info in self.by_monitor.get(int(monitor.handle), ())
+                if should_manage_style(info.style)]
+
+    def windows_for_monitor(self, monitor):
+        """Returns new Window objects for tileable windows on the monitor"""
+        return [Window(info.handle) for info in self.manageable(monitor)]
+
+    def window_positions(self, monitor):
+        """Returns a dictionary of Window: display size for the monitor"""
+        return {Window(info.handle): info.rect for info in self.manageable(monitor)}
+
+    @staticmethod
+    def query_window(handle, monitor_rects=()):
+        desktop = backend.get()
+        try:
+            if not desktop.is_window_visible(handle):
+                return WindowInfo(handle, None, 0, 0, False, False, None)
+            style = desktop.get_window_long(handle, GWL_STYLE)
+            if style & WS_MINIMIZE:
+                # what IsIconic tests, without asking again
+                return WindowInfo(handle, None, 0, 0, True, True, None)
+            rect = desktop.get_window_rect(handle)
+            monitor = locate(rect, monitor_rects)
+            if monitor is None:
+                monitor = desktop.monitor_from_window(handle)
+            return WindowInfo(
+                handle,
+                rect,
+                style,
+                None,
+                True,
+                False,
+                monitor
+            )
+        except BackendError:
+            # window was destroyed mid enumeration
+            return None
+
+    @staticmethod
+    def capture(monitors=()):
+        """Enumerates all top-level windows once and primes the window cache
+
+        Windows are assigned to the given monitors by their rects, only
+        windows outside all of them cost a MonitorFromWindow call.
+        """
+        monitor_rects = [(m.handle, m.display_resolution) for m in monitors
+                         if m.display_resolution is not None]
+        since = window_cache.generation()
+        windows = []
+        for handle in backend.get().enum_windows():
+            info = DesktopSnapshot.query_window(handle, monitor_rects)
+            if info is not None:
+                windows.append(info)
+        snapshot = DesktopSnapshot(windows)
+        window_cache.fill(snapshot, since)
+        return snapshot
@@ -0,0 +1,84 @@
+"""Contains the GridIndex class for finding overlapping rects quickly"""
+import collections
+
+
+def check_overlap(a, b):
+    """ return True if two display_size overlap """
+    if a[0] >= b[2] or a[1] >= b[3] or a[2] <= b[0] or a[3] <= b[1]:
+        return False
+    return True
+
+
+def overlap_area(a, b):
+    """ return area of overlap between two display_size """
+    return min(a[2] - b[0], b[2] - a[0]) * min(a[3] - b[1], b[3] - a[1])
+
+
+class GridIndex(object):
+    """Rects bucketed into a hash grid of square cells
+
+    A query only looks at keys sharing a cell with the queried rect, so its
+    cost depends on the rect's size and not on how many rects are indexed.
+    """
+
+    def __init__(self, cell_size=256):
+        self.cell_size = cell_size
+        self.cells = collections.defaultdict(set)
+        self.rects = {}
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __contains__(self, key):
+        return key in self.rects
+
+    def __cells(self, rect):
+        left, top, right, bottom = rect
+        size = self.cell_size
+        for x in range(left // size, max(right - 1, left) // size + 1):
+            for y in range(top // size, max(bottom - 1, top) // size + 1):
+                yield (x, y)
+
+    def get(self, key):
+        return self.rects.get(key)
+
+    def insert(self, key, rect):
+        """Adds key at rect, moving it if it is already indexed"""
+        rect = tuple(rect)
+        if self.rects.get(key) == rect:
+            return
+        self.remove(key)
+        self.rects[key] = rect
+        for cell in self.__cells(rect):
+            self.cells[cell].add(key)
+
+    def remove(self, key):
+        rect = self.rects.pop(key, None)
+        if rect is None:
+            return
+        for cell in self.__cells(rect):
+            bucket = self.cells[cell]
+            bucket.discard(key)
+            if not bucket:
+                del self.cells[cell]
+
+    def clear(self):
+        self.cells.clear()
+        self.rects.clear()
+
+    def overlapping(self, rect):
+        """Returns [(key, rect)] for every indexed rect overlapping rect"""
+        candidates = set()
+        for cell in self.__cells(rect):
+            candidates.update(self.cells.get(cell, ()))
+        return [(key, self.rects[key]) for key in candidates
+                if check_overlap(self.rects[key], rect)]
+
+    def best_overlap(self, rect):
+        """Returns (key, rect, area) of the largest overlap with rect, or None"""
+        best = None
+        for key, other in self.overlapping(rect):
+            area = overlap_area(other, rect)
+            if best is None or area > best[2]:
+                best = (key, other, area)
+        return best
@@ -1,24 +1,18 @@
 """Contains Tiler class for managing window placement"""
-import re
-import win32gui
-import win32api
-
-from win32con import MOUSEEVENTF_LEFTUP
-from win32con import MOUSEEVENTF_ABSOLUTE
+from wmpy.constants import HWND_NOTOPMOST
 
+from wmpy.backend import BackendError
+import wmpy.backend as backend
 import wmpy.config as config
+from wmpy.bsp import BSPTree, center
+from wmpy.log import get_logger, lazy
+from wmpy.metrics import metrics
+from wmpy.placement import Placement
+from wmpy.registry import WindowRegistry
+from wmpy.window import Window
+from wmpy.spatial import GridIndex, overlap_area
 
-
-def check_overlap(a, b):
-    """ return True if two display_size overlap """
-    if a[0] >= b[2] or a[1] >= b[3] or a[2] <= b[0] or a[3] <= b[1]:
-        return False
-    return True
-
-
-def overlap_area(a, b):
-    """ return area of overlap between two display_size """
-    return min(a[2] - b[0], b[2] - a[0]) * min(a[3] - b[1], b[3] - a[1])
+log = get_logger(__name__)
 
 
 def add_margin(region, margin):
@@ -26,179 +20,284 @@ def add_margin(region, margin):
 
 
 class Tiler(object):
-    """Manages a BSP tree for all windows in a monitor"""
+    """Manages a BSP tree for all windows in a monitor
 
-    def __init__(self, monitor):
-        self.monitor = monitor
-        self.start_positions = monitor.get_window_positions()
-        self.root = None
-        self.windows = []
-        self.swapping = False
+    Not thread-safe: a running WindowManager only touches tilers from its
+    event worker, other threads go through WindowManager.submit().
+    """
 
-        for window in self.start_positions.keys():
-            self.add_window(window)
+    def __init__(self, monitor, snapshot=None, registry=None):
+        self.monitor = monitor
+        self.start_positions = monitor.get_window_positions(snapshot)
+        self.tree = BSPTree()
+        # shared with the other tilers when given
+        self.registry = registry if registry is not None else WindowRegistry()
+        # ordered membership, Window -> None
+        self.windows = {}
+        # monitor geometry version of the last tile
+        self.geometry_version = None
+        # window -> rect (with margins) it was last moved to
+        self.applied = {}
+        # window -> rect of its tile, for finding swap targets
+        self.tiles = GridIndex()
+        self.moves_issued = 0
+        self.moves_skipped = 0
+        # how long the last tile_all() took to move this monitor's windows
+        self.placement_ms = None
+        # window -> rect it had before a restart, restored by the next tile
+        self.recovered = {}
+
+        for window in list(self.start_positions.keys()):
+            if window.handle in self.registry:
+                # another monitor's tiler owns it, see WindowManager.reconcile_window
+                del self.start_positions[window]
+            else:
+                self.add_window(window)
 
     def add_window(self, window):
         """Adds a window to the BSP tree"""
         if not self.valid_window(window):
             return False
-        self.windows.append(window)
+        self.windows[window] = None
         window.tiler = self
+        self.registry.add(window)
         if window not in self.start_positions.keys():
             self.start_positions[window] = window.display_size
+            self.apply_rules(window)
 
-            rules = config.GET_RULES(window.classname)
-            if rules is not None and re.search(rules["regex"], window.title) is not None:
-                if "floating" in rules:
-                    window.set_floating(rules["floating"])
-                if "decorated" in rules:
-                    if bool(rules["decorated"]):
-                        window.enable_decoration()
-                    else:
-                        window.disable_decoration()
-                if "position" in rules:
-                    window.move_to(tuple(rules["position"]))
-
-        print("Added window: {0}".format(window))
-        window.print_window_styles()
+        log.debug('added window: %s\n%s', window, lazy(window.format_window_styles))
         return True
 
+    def apply_rules(self, window, previous=None):
+        """Applies the config rule matching the window, if any
+
+        previous is the rule that matched before a config reload, what it
+        changed and the current rule no longer does is undone.
+        """
+        rules = config.RULES().match_window(window).rule or {}
+        previous = previous or {}
+        if "floating" in rules:
+            window.set_floating(rules["floating"])
+        elif previous.get("floating"):
+            window.set_floating(False)
+        if "decorated" in rules:
+            if bool(rules["decorated"]):
+                window.enable_decoration()
+            else:
+                window.disable_decoration()
+        elif "decorated" in previous and not previous["decorated"]:
+            window.enable_decoration()
+        if "position" in rules:
+            window.move_to(tuple(rules["position"]))
+
     def remove_window(self, window):
         if window in self.windows:
-            self.windows.remove(window)
+            # the registered object, window may only share its handle
+            window = self.get_window_from_handle(window.handle) or window
+            del self.windows[window]
+            self.registry.remove(window)
+            self.applied.pop(window, None)
+            self.recovered.pop(window, None)
+            self.tiles.remove(window)
+            if window in self.tree:
+                self.tree.remove(window)
             window.tiler = None
             return True
         return False
 
     def remove_window_by_handle(self, hwnd):
-        for w in self.windows:
-            if w.handle == hwnd:
-                return self.remove_window(w)
-        return False
+        window = self.get_window_from_handle(hwnd)
+        if window is None:
+            return False
+        return self.remove_window(window)
 
     def valid_window(self, window):
         return self.valid_window_by_handle(window.handle) and window.should_manage(self.monitor.display_size) and window not in self.windows
 
     def valid_window_by_handle(self, handle):
-        # check config rules
-        if win32gui.GetClassName(handle) in config.IGNORED_CLASSNAMES() or win32gui.GetWindowText(handle) in config.IGNORED_WINDOW_TITLES():
+        # check config rules, classname and title come from the window cache
+        window = Window(handle)
+        if window.classname is None:
+            # window is gone
             return False
-        return True
+        return not config.RULES().match_window(window).ignored
 
     def get_window_from_handle(self, handle):
-        for w in self.windows:
-            if w.handle == handle:
-                return w
+        window = self.registry.get(handle)
+        if window is not None and window.tiler is self:
+            return window
         return None
 
     def contains_window_by_handle(self, handle):
-        return any([w.handle == handle for w in self.windows])
+        return self.get_window_from_handle(handle) is not None
 
+    @metrics.timed('swap_windows', count_calls=True)
     def swap_windows(self, a, b):
-        if a not in self.windows or b not in self.windows or a.is_floating() or b.is_floating() or self.swapping:
+        if a not in self.windows or b not in self.windows or a.is_floating() or b.is_floating():
             return
-        print('swapping {0} and {1}'.format(a.title[:30], b.title[:30]))
-        region_a = a.region
-        region_b = b.region
+        log.debug('swapping %s and %s', a, b)
 
         # simulate a mouse release to stop dragging the window
         try:
-            x, y = win32api.GetCursorPos()
-            win32api.mouse_event(MOUSEEVENTF_ABSOLUTE +
-                                 MOUSEEVENTF_LEFTUP, 0, 0, 0, 0)
-        except win32api.error:
-            print('error faking drag release during window swap')
-
-        self.swapping = True
-        self.__move_window_to_region(a, region_b)
-        self.__move_window_to_region(b, region_a)
-        self.swapping = False
-
-    def tile_windows(self):
-        if self.swapping:
-            return
+            backend.get().release_mouse_button()
+        except BackendError:
+            log.warning('error faking drag release during window swap')
+
+        if a in self.tree and b in self.tree:
+            self.tree.swap(a, b)
+            self.__apply_layout(self.tree.take_changed())
+
+    def needs_relayout(self):
+        """Returns True if the monitor geometry changed since the last tile"""
+        return self.monitor.geometry.version != self.geometry_version
+
+    def find_swap_target(self, window, rect, threshold):
+        """Returns the tiled window whose tile rect overlaps most by threshold
+
+        Only the tile index is consulted, the other windows are not queried.
+        """
+        area = (rect[2] - rect[0]) * (rect[3] - rect[1])
+        best = None
+        for other, tile in self.tiles.overlapping(rect):
+            if other is window:
+                continue
+            overlap = overlap_area(tile, rect)
+            tile_area = (tile[2] - tile[0]) * (tile[3] - tile[1])
+            if overlap / area >= threshold or overlap / tile_area >= threshold:
+                if best is None or overlap > best[1]:
+                    best = (other, overlap)
+        return best[0] if best is not None else None
+
+    def recover_window(self, window, start, floating, decorated, rect):
+        """Takes over the state a window had before wmpy restarted
+
+        start is where it was before it was first tiled, rect where it was
+        last put. The next tile_windows() gives it the tile at rect again
+        and if it is still there it is not moved.
+        """
+        if start is not None:
+            self.start_positions[window] = start
+        window.floating = floating
+        window.is_decorated = decorated
+        if rect is not None and not floating:
+            self.recovered[window] = rect
+            if window.display_size == rect:
+                self.applied[window] = rect
+
+    def mark_moved(self, window):
+        """Forgets the applied rect of a window moved by something else"""
+        self.applied.pop(window, None)
+
+    @metrics.timed('tile_windows', count_calls=True)
+    def tile_windows(self, relayout=False, placement=None):
+        """Moves tiled windows into their BSP regions
+
+        Pass relayout=True to recompute every region and margin, e.g. after
+        the config changed. Moves are added to placement when one is given,
+        committing it and calling mark_moved() for failed windows is then up
+        to the caller, as is for deferred ones.
+        """
+        self.geometry_version = self.monitor.geometry.version
         region = add_margin(self.monitor.display_size,
                             config.DISPLAY_PADDING())
-        self.__tile_area(
-            region, [w for w in self.windows if not w.is_floating() and not w.do_not_manage])
 
-    def __move_window_to_region(self, window, region):
-        # save given region for window swapping
-        window.region = region
-        # apply margins and move
+        tiled = [w for w in self.windows if not w.is_floating() and not w.do_not_manage]
+        tiled_set = set(tiled)
+        for window in [w for w in self.tree.nodes if w not in tiled_set]:
+            self.tree.remove(window)
+        for window in tiled:
+            if window not in self.tree:
+                self.tree.insert(window, window.display_size)
+        self.tree.layout(region, config.WINDOW_SPLIT_RATIO(), force=relayout)
+        if self.recovered:
+            self.__restore_tiles()
+
+        layout = self.tree.take_changed()
+        for window in tiled:
+            if window not in self.applied and window not in layout:
+                # was moved by something else, put it back
+                layout[window] = self.tree.region_of(window)
+        for window in [w for w in self.applied if w not in tiled_set]:
+            # floating windows are no longer where we put them
+            del self.applied[window]
+        for window in [w for w in self.tiles.rects if w not in tiled_set]:
+            self.tiles.remove(window)
+        moved = self.__apply_layout(layout, placement)
+        self.moves_skipped += len(tiled) - moved
+
+    def __restore_tiles(self):
+        """Swaps recovered windows back into the tiles they had before the restart"""
+        recovered, self.recovered = self.recovered, {}
+        settled = set()
+        for window, rect in recovered.items():
+            if window not in self.tree:
+                continue
+            other = self.tree.window_at(center(rect))
+            if other is None or other in settled:
+                continue
+            if other != window:
+                self.tree.swap(window, other)
+            settled.add(window)
+
+    def retile_windows(self, windows):
+        """Moves some windows back into their regions, e.g. after their margins changed"""
+        self.__apply_layout({w: self.tree.region_of(w) for w in windows if w in self.tree})
+
+    def __apply_layout(self, layout, placement=None):
+        """Moves only the windows whose target rect differs from the last one applied"""
+        shared = placement is not None
+        if not shared:
+            placement = Placement()
+        queued = len(placement)
+        for window, region in layout.items():
+            # save given region for window swapping
+            window.region = region
+            rect = self.__window_rect(window, region)
+            self.tiles.insert(window, rect)
+            if self.applied.get(window) == rect:
+                continue
+            placement.add(window, rect)
+            self.applied[window] = rect
+        moved = len(placement) - queued
+        self.moves_issued += moved
+        if not shared:
+            placement.commit()
+            # tiled again by the next tile_windows()
+            for window in placement.failed + placement.deferred:
+                self.applied.pop(window, None)
+        return moved
+
+    def __window_rect(self, window, region):
+        # apply margins
         region = add_margin(region, config.WINDOW_MARGIN())
 
         # special regions
-        if window.classname in config.SPECIAL_MARGINS():
-            # check the regex
-            special_margin = config.SPECIAL_MARGINS()[window.classname]
-            if re.search(special_margin[0], window.title) is not None:
-                region = add_margin(region, special_margin[1])
-
-        window.move_to(region)
+        special_margin = config.RULES().match_window(window).special_margin
+        if special_margin is not None:
+            region = add_margin(region, special_margin)
 
-    def __tile_area(self, area, windows):
-        if len(windows) == 0:
-            return
-        if len(windows) == 1:
-            # we've found a region for the window
-            self.__move_window_to_region(windows[0], area)
-            return
-
-        left, top, right, bottom = area
-        width = right - left
-        height = bottom - top
-        horizontal_split = True if width >= height * \
-            config.WINDOW_SPLIT_RATIO() else False
-
-        width //= 2
-        height //= 2
-        if horizontal_split:
-            regions = [
-                (left, top, left + width, bottom),
-                (left + width, top, right, bottom)
-            ]
-        else:
-            regions = [
-                (left, top, right, top + height),
-                (left, top + height, right, bottom)
-            ]
-        windows_by_region = [[], []]
-        sorted_windows = sorted(
-            windows, key=lambda w: w.display_area, reverse=True)
-        for w in sorted_windows:
-            if len(windows_by_region[0]) == len(windows_by_region[1]):
-                # tree is currently balanced, keep window in closest region
-                overlap = [overlap_area(w.display_size, r) if check_overlap(
-                    w.display_size, r) else 0 for r in regions]
-                if overlap[0] >= overlap[1]:
-                    windows_by_region[0].append(w)
-                else:
-                    windows_by_region[1].append(w)
-            else:
-                # tree is unbalanced, add to less full region
-                if len(windows_by_region[0]) < len(windows_by_region[1]):
-                    windows_by_region[0].append(w)
-                else:
-                    windows_by_region[1].append(w)
-        for i in range(2):
-            self.__tile_area(regions[i], windows_by_region[i])
+        return region
 
     def restore_positions(self, positions):
         """Restores all windows to the given positions"""
+        placement = Placement()
         for window, position in positions.items():
             # result = window.enable_decoration()
             # if not result:
-            #     print('error setting window decoration')
-            result = window.set_floating(False)
-            if not result:
-                print('error setting window to non-floating')
+            #     log.warning('error setting window decoration')
             if window in self.windows:
-                window.move_to(position)
+                # un-topmost and move in the same batched operation
+                placement.add(window, position,
+                              HWND_NOTOPMOST if window.is_floating() else None)
+                window.floating = False
+            elif not window.set_floating(False):
+                log.warning('error setting %s to non-floating', window)
+        if not placement.commit():
+            log.warning('error restoring %d window(s)', len(placement.failed))
 
     def restore_window_position(self, positions, window):
         result = window.set_floating(False)
         if not result:
-            print('error setting window to non-floating')
+            log.warning('error setting %s to non-floating', window)
         if window in self.windows:
             window.move_to(positions[window])
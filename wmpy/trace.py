@@ -0,0 +1,391 @@
+"""Contains the TraceRecorder and replay() for reproducing hooked event streams
+
+A trace is an append-only binary file starting with MAGIC, followed by
+records of a kind byte, a uint32 tick count and a payload:
+
+    E  event, hwnd, idObject, idChild
+    W  state of one window after an event (rect, styles, title, classname)
+    S  JSON snapshot of every monitor and window
+    D  monitor layout or work area changed
+
+Set "TraceFile" in config.json to record, then replay the trace against a
+SimulatedDesktop to get per-event handler latencies:
+
+    python -m wmpy.trace FILE [--speed 1.0] [--json]
+"""
+import argparse
+import collections
+import json
+import queue
+import struct
+import sys
+import threading
+import time
+
+from wmpy.constants import CHILDID_SELF
+from wmpy.constants import EVENT_OBJECT_DESTROY
+from wmpy.constants import GWL_STYLE
+from wmpy.constants import GWL_EXSTYLE
+from wmpy.constants import MONITORINFOF_PRIMARY
+from wmpy.constants import OBJID_WINDOW
+
+from wmpy.backend import BackendError
+import wmpy.backend as backend
+from wmpy.events import event_name
+from wmpy.log import get_logger, setup as setup_logging
+
+log = get_logger(__name__)
+
+MAGIC = b'WMPYTRC1'
+
+HEADER = struct.Struct('<cI')
+EVENT = struct.Struct('<IQii')
+WINDOW = struct.Struct('<QiiiiIIB')
+LENGTH = struct.Struct('<I')
+TEXT_LENGTH = struct.Struct('<H')
+
+VISIBLE = 1
+ICONIC = 2
+
+# seconds between full snapshots while recording
+SNAPSHOT_INTERVAL = 60
+# seconds between flushes while events keep coming
+FLUSH_INTERVAL = 1
+
+
+def query_window_state(desktop, hwnd):
+    """Returns everything the simulator needs to recreate a window"""
+    return {
+        "handle": hwnd,
+        "rect": list(desktop.get_window_rect(hwnd)),
+        "title": desktop.get_window_text(hwnd),
+        "classname": desktop.get_class_name(hwnd),
+        "style": desktop.get_window_long(hwnd, GWL_STYLE) & 0xFFFFFFFF,
+        "exstyle": desktop.get_window_long(hwnd, GWL_EXSTYLE) & 0xFFFFFFFF,
+        "visible": desktop.is_window_visible(hwnd),
+        "iconic": desktop.is_iconic(hwnd)
+    }
+
+
+def query_desktop_state(desktop):
+    monitors = []
+    for handle in desktop.enum_monitors():
+        info = desktop.get_monitor_info(handle)
+        monitors.append({
+            "handle": int(handle),
+            "rect": list(info["Monitor"]),
+            "work": list(info["Work"]),
+            "primary": bool(info["Flags"] & MONITORINFOF_PRIMARY)
+        })
+    windows = []
+    for hwnd in desktop.enum_windows():
+        try:
+            windows.append(query_window_state(desktop, hwnd))
+        except BackendError:
+            # destroyed while enumerating
+            pass
+    return {"monitors": monitors, "windows": windows}
+
+
+def encode_window(state):
+    flags = (VISIBLE if state["visible"] else 0) | (ICONIC if state["iconic"] else 0)
+    title = state["title"].encode('utf-8')[:0xFFFF]
+    classname = state["classname"].encode('utf-8')[:0xFFFF]
+    return b''.join((
+        WINDOW.pack(state["handle"], *state["rect"], state["style"], state["exstyle"], flags),
+        TEXT_LENGTH.pack(len(title)), title,
+        TEXT_LENGTH.pack(len(classname)), classname))
+
+
+class TraceRecorder(object):
+    """Streams hooked events and desktop snapshots to a trace file
+
+    event() and display() run on the hook thread and only queue; a writer
+    thread queries window state and appends records, so recording adds no
+    Win32 calls to the hook callback.
+    """
+
+    def __init__(self, path, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.records = queue.Queue()
+        self.file = None
+        self.thread = None
+        self.written = 0
+
+    def start(self):
+        self.file = open(self.path, 'wb')
+        self.file.write(MAGIC)
+        self.write_snapshot()
+        self.file.flush()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.records.put(None)
+        self.thread.join()
+        self.thread = None
+        self.file.close()
+
+    def event(self, event, hwnd, id_object, id_child, dwmsEventTime):
+        # NULL hwnds, e.g. of the cursor, arrive as None
+        self.records.put((event, hwnd or 0, id_object, id_child, dwmsEventTime))
+
+    def display(self):
+        self.records.put(())
+
+    def run(self):
+        next_snapshot = time.monotonic() + self.snapshot_interval
+        next_flush = time.monotonic() + FLUSH_INTERVAL
+        while True:
+            try:
+                record = self.records.get(
+                    timeout=max(next_snapshot - time.monotonic(), 0))
+            except queue.Empty:
+                record = False
+            if record is None:
+                break
+            try:
+                if record is False:
+                    self.write_snapshot()
+                    next_snapshot = time.monotonic() + self.snapshot_interval
+                elif record == ():
+                    self.write(b'D', backend.get().tick_count(), b'')
+                    # the snapshot carries the new monitor layout
+                    self.write_snapshot()
+                else:
+                    self.write_event(*record)
+            except (BackendError, OSError) as e:
+                log.error('error writing trace record: %s', e)
+            except Exception:
+                # one bad record must not end the recording
+                log.exception('error writing trace record %r', record)
+            if self.records.empty() or time.monotonic() >= next_flush:
+                try:
+                    self.file.flush()
+                except OSError as e:
+                    log.error('error flushing trace: %s', e)
+                next_flush = time.monotonic() + FLUSH_INTERVAL
+
+    def write(self, kind, timestamp, payload):
+        self.file.write(HEADER.pack(kind, timestamp & 0xFFFFFFFF) + payload)
+        self.written += 1
+
+    def write_event(self, event, hwnd, id_object, id_child, dwmsEventTime):
+        if (hwnd and event != EVENT_OBJECT_DESTROY
+                and id_object == OBJID_WINDOW and id_child == CHILDID_SELF):
+            try:
+                state = query_window_state(backend.get(), hwnd)
+            except BackendError:
+                state = None
+            if state is not None:
+                self.write(b'W', dwmsEventTime, encode_window(state))
+        self.write(b'E', dwmsEventTime, EVENT.pack(event, hwnd, id_object, id_child))
+
+    def write_snapshot(self):
+        desktop = backend.get()
+        payload = json.dumps(query_desktop_state(desktop)).encode('utf-8')
+        self.write(b'S', desktop.tick_count(), LENGTH.pack(len(payload)) + payload)
+
+
+def read_trace(path):
+    """Yields (kind, timestamp, value) for every complete record in a trace
+
+    A record cut short, e.g. by a crash while recording, ends the trace.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError('{0} is not a wmpy trace'.format(path))
+    offset = len(MAGIC)
+    try:
+        while offset < len(data):
+            kind, timestamp = HEADER.unpack_from(data, offset)
+            offset += HEADER.size
+            if kind == b'E':
+                value = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                yield 'event', timestamp, value
+            elif kind == b'W':
+                handle, left, top, right, bottom, style, exstyle, flags = WINDOW.unpack_from(data, offset)
+                offset += WINDOW.size
+                texts = []
+                for _ in range(2):
+                    length, = TEXT_LENGTH.unpack_from(data, offset)
+                    offset += TEXT_LENGTH.size
+                    if offset + length > len(data):
+                        return
+                    texts.append(data[offset:offset + length].decode('utf-8', 'replace'))
+                    offset += length
+                yield 'window', timestamp, {
+                    "handle": handle,
+                    "rect": [left, top, right, bottom],
+                    "title": texts[0],
+                    "classname": texts[1],
+                    "style": style,
+                    "exstyle": exstyle,
+                    "visible": bool(flags & VISIBLE),
+                    "iconic": bool(flags & ICONIC)
+                }
+            elif kind == b'S':
+                length, = LENGTH.unpack_from(data, offset)
+                offset += LENGTH.size
+                if offset + length > len(data):
+                    return
+                yield 'snapshot', timestamp, json.loads(data[offset:offset + length].decode('utf-8'))
+                offset += length
+            elif kind == b'D':
+                yield 'display', timestamp, None
+            else:
+                raise ValueError('unknown trace record {0!r} at {1}'.format(kind, offset))
+    except struct.error:
+        return
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class ReplayReport(object):
+    """Handler latencies per event, in seconds"""
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.calls = collections.Counter()
+        self.events = 0
+
+    def add(self, name, seconds):
+        self.latencies[name].append(seconds)
+
+    def summary(self):
+        return {
+            "events": self.events,
+            "backend_calls": sum(self.calls.values()),
+            "handlers": {
+                name: {
+                    "count": len(values),
+                    "mean_ms": sum(values) / len(values) * 1000,
+                    "p50_ms": percentile(values, 0.5) * 1000,
+                    "p95_ms": percentile(values, 0.95) * 1000,
+                    "max_ms": max(values) * 1000
+                } for name, values in sorted(self.latencies.items())
+            }
+        }
+
+    def print(self, out=sys.stdout):
+        summary = self.summary()
+        print('{0} events, {1} backend calls'.format(
+            summary["events"], summary["backend_calls"]), file=out)
+        print('{0:<30} {1:>7} {2:>9} {3:>9} {4:>9} {5:>9}'.format(
+            'handler', 'count', 'mean ms', 'p50 ms', 'p95 ms', 'max ms'), file=out)
+        for name, row in summary["handlers"].items():
+            print('{0:<30} {1:>7} {2:>9.3f} {3:>9.3f} {4:>9.3f} {5:>9.3f}'.format(
+                name, row["count"], row["mean_ms"], row["p50_ms"], row["p95_ms"],
+                row["max_ms"]), file=out)
+
+
+def load_desktop_state(desktop, state):
+    """Replaces the simulated monitors and windows with a recorded snapshot"""
+    from wmpy.simulated import SimulatedMonitor
+    desktop.monitors.clear()
+    for monitor in state["monitors"]:
+        desktop.monitors[monitor["handle"]] = SimulatedMonitor(
+            monitor["rect"], monitor["work"], monitor["primary"])
+    desktop.windows.clear()
+    for window in state["windows"]:
+        load_window_state(desktop, window)
+
+
+def load_window_state(desktop, state):
+    from wmpy.simulated import SimulatedWindow
+    desktop.windows[state["handle"]] = SimulatedWindow(
+        state["rect"], state["title"], state["classname"], state["style"],
+        state["exstyle"], state["visible"], state["iconic"])
+
+
+def replay(path, speed=None, desktop=None):
+    """Feeds a trace into a WindowManager running on a simulated desktop
+
+    Events are dispatched one at a time, as fast as possible or, with speed,
+    paced like the recording (2.0 is twice as fast). Returns a ReplayReport.
+    """
+    from wmpy.manager import WindowManager
+    from wmpy.simulated import SimulatedDesktop
+
+    records = read_trace(path)
+    first = next(records, None)
+    if first is None or first[0] != 'snapshot':
+        raise ValueError('{0} does not start with a snapshot'.format(path))
+    if desktop is None:
+        desktop = SimulatedDesktop()
+    backend.use(desktop)
+    load_desktop_state(desktop, first[2])
+    desktop.clock = first[1]
+
+    wm = WindowManager()
+    for tiler in wm.tilers:
+        tiler.tile_windows()
+    wm.init_events()
+    wm.events.scheduler.clock = desktop.monotonic
+
+    report = ReplayReport()
+    desktop.reset_calls()
+    started = time.monotonic()
+    for kind, timestamp, value in records:
+        if speed:
+            delay = ((timestamp - first[1]) & 0xFFFFFFFF) / 1000 / speed
+            wait = started + delay - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        desktop.clock = timestamp
+        if kind == 'window':
+            load_window_state(desktop, value)
+            continue
+        if kind == 'snapshot':
+            load_desktop_state(desktop, value)
+            name = 'resync'
+            start = time.perf_counter()
+            wm.resync()
+        else:
+            if kind == 'event':
+                event, hwnd, id_object, id_child = value
+                if event == EVENT_OBJECT_DESTROY:
+                    desktop.windows.pop(hwnd, None)
+                report.events += 1
+                name = event_name(event)
+                # recorded as 0, hooked as None
+                wm.handle_win_event(event, hwnd or None, id_object, id_child, timestamp)
+            else:
+                name = 'display change'
+                wm.handle_display_change()
+            start = time.perf_counter()
+            if not wm.events.dispatch_pending():
+                # filtered out or not handled
+                continue
+        report.add(name, time.perf_counter() - start)
+    report.calls.update(desktop.calls)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays a wmpy trace')
+    parser.add_argument('trace')
+    parser.add_argument('--speed', type=float,
+                        help='pace events like the recording, e.g. 1.0 for real time')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    args = parser.parse_args()
+    # log lines go to stderr, apart from the report
+    setup_logging()
+    report = replay(args.trace, args.speed)
+    if args.json:
+        print(json.dumps(report.summary(), indent=4))
+    else:
+        report.print()
+
+
+if __name__ == '__main__':
+    main()
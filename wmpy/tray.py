@@ -0,0 +1,108 @@
+"""Contains the wmpyTaskBar class, the tray icon and menu of a running WindowManager"""
+import concurrent.futures
+import os
+import wx
+import wx.adv
+
+from wmpy.log import get_logger
+from wmpy.metrics import format_stats
+
+TRAY_TOOLTIP = 'wmpy'
+TRAY_ICON_PATH = os.path.join(os.getcwd(), 'icon', 'icon.ico')
+# seconds the UI waits for the window manager to answer
+COMMAND_TIMEOUT = 2
+STATS_PATH = os.path.join(os.getcwd(), 'wmpy-stats.json')
+# menu ids of windows are FIRST_WINDOW_ID + their MenuModel id
+FIRST_WINDOW_ID = wx.ID_HIGHEST + 1
+MAX_MENU_WINDOWS = 1000
+
+log = get_logger(__name__)
+
+
+class wmpyTaskBar(wx.adv.TaskBarIcon):
+    def __init__(self, wm, menu):
+        super(wx.adv.TaskBarIcon, self).__init__()
+        self.wm = wm
+        self.menu = menu
+        self.set_icon(TRAY_ICON_PATH)
+        self.Bind(wx.adv.EVT_TASKBAR_LEFT_DOWN, self.on_clicked)
+        # bound once, the menu is rebuilt with the same ids on every open
+        self.refresh_id = wx.NewIdRef()
+        self.stats_id = wx.NewIdRef()
+        self.dump_stats_id = wx.NewIdRef()
+        self.Bind(wx.EVT_MENU, self.on_refresh, id=self.refresh_id)
+        self.Bind(wx.EVT_MENU, self.on_stats, id=self.stats_id)
+        self.Bind(wx.EVT_MENU, self.on_dump_stats, id=self.dump_stats_id)
+        self.Bind(wx.EVT_MENU, self.on_exit, id=wx.ID_EXIT)
+        # window ids are reused as windows come and go
+        self.Bind(wx.EVT_MENU, self.float_clicked, id=FIRST_WINDOW_ID,
+                  id2=FIRST_WINDOW_ID + MAX_MENU_WINDOWS - 1)
+
+    def CreatePopupMenu(self):
+        menu = wx.Menu()
+
+        # refresh
+        menu.Append(self.refresh_id, 'Refresh')
+
+        # stats
+        menu.Append(self.stats_id, 'Stats')
+        menu.Append(self.dump_stats_id, 'Dump Stats')
+        menu.AppendSeparator()
+
+        # tilers, from the model the manager keeps current
+        for monitor_label, windows in self.menu.snapshot():
+            # submenu for each display tiler
+            tiler_submenu = wx.Menu()
+            menu.AppendSubMenu(tiler_submenu, monitor_label)
+
+            # show windows under submenu, with check for floating
+            for id, label, floating in windows:
+                if id >= MAX_MENU_WINDOWS:
+                    continue
+                window_item = tiler_submenu.AppendCheckItem(
+                    FIRST_WINDOW_ID + id, label)
+                window_item.Check(floating)
+
+        # exit
+        menu.AppendSeparator()
+        menu.Append(wx.ID_EXIT, 'Exit')
+
+        return menu
+
+    def set_icon(self, path):
+        icon = wx.Icon()
+        icon.LoadFile(path)
+        self.SetIcon(icon, TRAY_TOOLTIP)
+
+    def float_clicked(self, event):
+        window = self.menu.window(event.GetId() - FIRST_WINDOW_ID)
+        if window is not None:
+            self.wm.toggle_floating(window)
+
+    def on_clicked(self, event):
+        # when taskbar icon is clicked
+        self.on_refresh(event)
+
+    def on_refresh(self, event):
+        self.wm.refresh().add_done_callback(
+            lambda future: wx.CallAfter(self.ShowBalloon, 'wmpy', 'Refreshed and Retiled!'))
+
+    def on_stats(self, event):
+        try:
+            stats = self.wm.stats().result(timeout=COMMAND_TIMEOUT)
+        except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+            return
+        wx.MessageBox(format_stats(stats), 'wmpy stats')
+
+    def on_dump_stats(self, event):
+        self.wm.dump_stats(STATS_PATH).add_done_callback(
+            lambda future: wx.CallAfter(self.ShowBalloon, 'wmpy', 'Stats written to ' + STATS_PATH))
+
+    def on_exit(self, event):
+        try:
+            self.wm.restore().result(timeout=COMMAND_TIMEOUT)
+        except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+            log.warning('timed out restoring window positions')
+        self.wm.stop()
+
+        wx.CallAfter(self.Destroy)
@@ -0,0 +1,215 @@
+"""Contains the Win32Backend class, the pywin32 implementation of Backend"""
+import ctypes
+import ctypes.wintypes
+import functools
+import pywintypes
+import win32api
+import win32gui
+
+from wmpy.backend import Backend, BackendError
+from wmpy.constants import MONITOR_DEFAULTTONEAREST
+from wmpy.constants import MOUSEEVENTF_ABSOLUTE
+from wmpy.constants import MOUSEEVENTF_LEFTUP
+from wmpy.constants import SPI_SETWORKAREA
+from wmpy.constants import WINEVENT_OUTOFCONTEXT
+from wmpy.constants import WM_DISPLAYCHANGE
+from wmpy.constants import WM_QUIT
+from wmpy.constants import WM_SETTINGCHANGE
+
+
+def checked(func):
+    """Turns pywin32 errors into BackendError"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except pywintypes.error as e:
+            raise BackendError(*e.args)
+    return wrapper
+
+
+class Win32Backend(Backend):
+    """Talks to the real desktop through pywin32 and user32"""
+
+    def __init__(self):
+        user32 = ctypes.windll.user32
+        user32.BeginDeferWindowPos.restype = ctypes.c_void_p
+        user32.BeginDeferWindowPos.argtypes = [ctypes.c_int]
+        user32.DeferWindowPos.restype = ctypes.c_void_p
+        user32.DeferWindowPos.argtypes = [
+            ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+            ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+            ctypes.c_uint]
+        user32.EndDeferWindowPos.restype = ctypes.c_bool
+        user32.EndDeferWindowPos.argtypes = [ctypes.c_void_p]
+        self.user32 = user32
+        self.ole32 = ctypes.windll.ole32
+
+    # windows
+
+    @checked
+    def enum_windows(self):
+        def callback(hwnd, handles):
+            handles.append(hwnd)
+            return True
+        handles = []
+        win32gui.EnumWindows(callback, handles)
+        return handles
+
+    def is_window(self, hwnd):
+        return bool(win32gui.IsWindow(hwnd))
+
+    def is_window_visible(self, hwnd):
+        return bool(win32gui.IsWindowVisible(hwnd))
+
+    def is_iconic(self, hwnd):
+        return bool(win32gui.IsIconic(hwnd))
+
+    @checked
+    def get_window_rect(self, hwnd):
+        return win32gui.GetWindowRect(hwnd)
+
+    @checked
+    def get_window_text(self, hwnd):
+        return win32gui.GetWindowText(hwnd)
+
+    @checked
+    def get_class_name(self, hwnd):
+        return win32gui.GetClassName(hwnd)
+
+    @checked
+    def get_window_long(self, hwnd, index):
+        return win32gui.GetWindowLong(hwnd, index)
+
+    @checked
+    def set_window_long(self, hwnd, index, value):
+        return win32gui.SetWindowLong(hwnd, index, value)
+
+    @checked
+    def move_window(self, hwnd, rect):
+        left, top, right, bottom = rect
+        win32gui.MoveWindow(hwnd, left, top, right - left, bottom - top, True)
+        win32gui.UpdateWindow(hwnd)
+
+    @checked
+    def set_window_pos(self, hwnd, insert_after, rect, flags):
+        left, top, right, bottom = rect if rect is not None else (0, 0, 0, 0)
+        win32gui.SetWindowPos(
+            hwnd, insert_after, left, top, right - left, bottom - top, flags)
+
+    def apply_window_positions(self, entries):
+        hdwp = self.user32.BeginDeferWindowPos(len(entries))
+        if not hdwp:
+            return False
+        for hwnd, insert_after, rect, flags in entries:
+            left, top, right, bottom = rect
+            hdwp = self.user32.DeferWindowPos(
+                hdwp, hwnd, insert_after, left, top,
+                right - left, bottom - top, flags)
+            if not hdwp:
+                # the failed DeferWindowPos already freed the batch
+                return False
+        return self.user32.EndDeferWindowPos(hdwp)
+
+    def is_hung(self, hwnd):
+        return bool(self.user32.IsHungAppWindow(hwnd))
+
+    @checked
+    def release_mouse_button(self):
+        win32api.mouse_event(MOUSEEVENTF_ABSOLUTE + MOUSEEVENTF_LEFTUP, 0, 0, 0, 0)
+
+    # monitors
+
+    @checked
+    def enum_monitors(self):
+        return [int(handle) for handle, _, _ in win32api.EnumDisplayMonitors()]
+
+    @checked
+    def get_monitor_info(self, handle):
+        return win32api.GetMonitorInfo(handle)
+
+    @checked
+    def monitor_from_window(self, hwnd):
+        return int(win32api.MonitorFromWindow(hwnd, MONITOR_DEFAULTTONEAREST))
+
+    # events
+
+    def tick_count(self):
+        return win32api.GetTickCount()
+
+    def run_message_loop(self, hook_ranges, on_event, on_display_change):
+        user32 = self.user32
+        self.ole32.CoInitialize(0)
+
+        WinEventProcType = ctypes.WINFUNCTYPE(
+            None,
+            ctypes.wintypes.HANDLE,
+            ctypes.wintypes.DWORD,
+            ctypes.wintypes.HWND,
+            ctypes.wintypes.LONG,
+            ctypes.wintypes.LONG,
+            ctypes.wintypes.DWORD,
+            ctypes.wintypes.DWORD
+        )
+
+        def callback(hWinEventHook, event, hwnd, idObject, idChild, dwEventThread, dwmsEventTime):
+            on_event(event, hwnd, idObject, idChild, dwmsEventTime)
+
+        # keep a reference, the hook must outlive the loop
+        self.WinEventProc = WinEventProcType(callback)
+        user32.SetWinEventHook.restype = ctypes.wintypes.HANDLE
+
+        hooks = []
+        for event_min, event_max in hook_ranges:
+            hook = user32.SetWinEventHook(
+                event_min,
+                event_max,
+                0,
+                self.WinEventProc,
+                0,
+                0,
+                WINEVENT_OUTOFCONTEXT
+            )
+            if not hook:
+                for hook in hooks:
+                    user32.UnhookWinEvent(hook)
+                self.ole32.CoUninitialize()
+                raise BackendError(ctypes.get_last_error(), 'SetWinEventHook failed')
+            hooks.append(hook)
+        listener = self.create_listener_window(on_display_change)
+
+        msg = ctypes.wintypes.MSG()
+        while user32.GetMessageW(ctypes.byref(msg), 0, 0, 0) != 0:
+            user32.TranslateMessage(ctypes.byref(msg))
+            user32.DispatchMessageW(ctypes.byref(msg))
+
+        for hook in hooks:
+            user32.UnhookWinEvent(hook)
+        win32gui.DestroyWindow(listener)
+        self.ole32.CoUninitialize()
+
+    def create_listener_window(self, on_display_change):
+        """Creates a hidden top-level window that receives display broadcasts"""
+        def on_display_message(hwnd, msg, wparam, lparam):
+            on_display_change()
+            return 0
+
+        def on_setting_message(hwnd, msg, wparam, lparam):
+            if wparam == SPI_SETWORKAREA:
+                # taskbar moved or resized
+                on_display_change()
+            return 0
+
+        wc = win32gui.WNDCLASS()
+        wc.hInstance = win32api.GetModuleHandle(None)
+        wc.lpszClassName = 'wmpyDisplayListener'
+        wc.lpfnWndProc = {
+            WM_DISPLAYCHANGE: on_display_message,
+            WM_SETTINGCHANGE: on_setting_message
+        }
+        class_atom = win32gui.RegisterClass(wc)
+        return win32gui.CreateWindow(
+            class_atom, 'wmpy', 0, 0, 0, 0, 0, 0, 0, wc.hInstance, None)
+
+    def quit_message_loop(self, thread_id):
+        self.user32.PostThreadMessageW(thread_id, WM_QUIT, 0, 0)
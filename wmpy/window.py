@@ -1,25 +1,25 @@
-import win32api
-import win32gui
+from wmpy.constants import SWP_FRAMECHANGED
+from wmpy.constants import SWP_NOMOVE
+from wmpy.constants import SWP_NOSIZE
+from wmpy.constants import SWP_NOZORDER
 
-from win32con import SWP_FRAMECHANGED
-from win32con import SWP_NOMOVE
-from win32con import SWP_NOSIZE
-from win32con import SWP_NOZORDER
+from wmpy.constants import GWL_STYLE
+from wmpy.constants import GWL_EXSTYLE
 
-from win32con import WM_CLOSE
+from wmpy.constants import *
 
-from win32con import GWL_STYLE
-from win32con import GWL_EXSTYLE
+from wmpy.backend import BackendError
+import wmpy.backend as backend
+from wmpy.cache import window_cache
+from wmpy.guard import guard, WindowTimeout
+from wmpy.log import get_logger
 
-from win32con import GW_OWNER
+log = get_logger(__name__)
 
-from win32con import WS_EX_TOOLWINDOW
-from win32con import WS_EX_APPWINDOW
-from win32con import WS_EX_WINDOWEDGE
 
-from win32con import *
-
-from wmpy.tiler import check_overlap, overlap_area
+def should_manage_style(style_value):
+    """Returns True if a visible window with this style can be tiled"""
+    return bool(style_value & WS_SIZEBOX and not style_value & WS_MAXIMIZE and not style_value & WS_POPUP)
 
 
 class Window(object):
@@ -39,7 +39,7 @@ class Window(object):
     def __str__(self):
         try:
             left, top, right, bottom = self.display_size
-            title = self.title
+            title = self.display_title
             classname = self.classname
             return "{title} [{classname}] ({width}x{height} @ ({left}, {top}) [{handle}]".format(
                 title=title,
@@ -54,7 +54,8 @@ class Window(object):
             # window may be destroyed, leading to properties returning None
             return 'Destroyed window [{0}]'.format(self.handle)
 
-    def print_window_styles(self):
+    def format_window_styles(self):
+        """Returns a two column table of the window's style flags"""
         styles = {
             GWL_STYLE: (
                 ('WS_BORDER', WS_BORDER),
@@ -114,17 +115,19 @@ class Window(object):
                 ('WS_EX_WINDOWEDGE', WS_EX_WINDOWEDGE)
             )
         }
+        lines = []
         for style in styles.items():
-            value = win32gui.GetWindowLong(self.handle, style[0])
+            value = self.exstyle if style[0] == GWL_EXSTYLE else self.style
             for i in range(0, len(style[1]), 2):
                 if i + 1 == len(style[1]):
-                    print('{0:32} : {1:d}'.format(
+                    lines.append('{0:32} : {1:d}'.format(
                         style[1][i][0], bool(value & style[1][i][1])))
                     continue
                 s1 = style[1][i]
                 s2 = style[1][i + 1]
-                print('{0:32} : {1:d}    {2:32} : {3:d}'.format(
+                lines.append('{0:32} : {1:d}    {2:32} : {3:d}'.format(
                     s1[0], bool(value & s1[1]), s2[0], bool(value & s2[1])))
+        return '\n'.join(lines)
 
     def set_managed(self, should_manage):
         if self.do_not_manage == should_manage:
@@ -134,69 +137,83 @@ class Window(object):
     def should_manage(self, monitor_display_size):
         if self.do_not_manage:
             return False
-        if win32gui.IsWindowVisible(self.handle) and not win32gui.IsIconic(self.handle):
-            style_value = win32gui.GetWindowLong(self.handle, GWL_STYLE)
-            if style_value & WS_SIZEBOX and not style_value & WS_MAXIMIZE and not style_value & WS_POPUP:
-                return True
-            ex_style_value = win32gui.GetWindowLong(self.handle, GWL_EXSTYLE)
+        if self.visible and not self.iconic:
+            return should_manage_style(self.style)
         return False
 
     def move_to(self, position):
         try:
-            win32gui.MoveWindow(
-                self.handle,
-                position[0],
-                position[1],
-                position[2] - position[0],
-                position[3] - position[1],
-                True
-            )
-            win32gui.UpdateWindow(self.handle)
+            if guard.is_hung(self.handle):
+                guard.post(self.handle, 0, tuple(position), SWP_NOZORDER + SWP_NOACTIVATE)
+            else:
+                guard.call([self.handle], backend.get().move_window, self.handle, tuple(position))
             return True
-        except win32gui.error:
+        except WindowTimeout:
+            guard.defer(self.handle, retry=lambda: self.move_to(position))
+            return False
+        except BackendError:
             return False
+        finally:
+            window_cache.forget(self.handle, ('rect',))
 
     def update(self):
+        flags = SWP_FRAMECHANGED + SWP_NOMOVE + SWP_NOSIZE + SWP_NOZORDER
         try:
-            win32gui.SetWindowPos(
-                self.handle,
-                0,
-                0,
-                0,
-                0,
-                0,
-                SWP_FRAMECHANGED + SWP_NOMOVE + SWP_NOSIZE + SWP_NOZORDER
-            )
+            if guard.is_hung(self.handle):
+                guard.post(self.handle, 0, None, flags)
+            else:
+                guard.call([self.handle], backend.get().set_window_pos,
+                           self.handle, 0, None, flags)
             return True
-        except win32gui.error:
+        except WindowTimeout:
+            guard.defer(self.handle, retry=self.update)
+            return False
+        except BackendError:
             return False
 
     def enable_decoration(self):
         if self.is_decorated:
             return True
+        if guard.is_hung(self.handle):
+            # SetWindowLong cannot be posted, left for when it answers again
+            guard.defer(self.handle, retry=self.enable_decoration)
+            return False
         try:
-            style = win32gui.GetWindowLong(self.handle, GWL_STYLE)
-            style += WS_CAPTION
-            win32gui.SetWindowLong(self.handle, GWL_STYLE, style)
+            style = backend.get().get_window_long(self.handle, GWL_STYLE)
+            style |= WS_CAPTION
+            guard.call([self.handle], backend.get().set_window_long,
+                       self.handle, GWL_STYLE, style)
+            window_cache.forget(self.handle, ('style',))
             self.is_decorated = True
             self.update()
             return True
-        except win32gui.error:
-            print('error adding decoration')
+        except WindowTimeout:
+            guard.defer(self.handle, retry=self.enable_decoration)
+            return False
+        except BackendError:
+            log.warning('error adding decoration to %s', self.handle)
             return False
 
     def disable_decoration(self):
         if not self.is_decorated:
             return True
+        if guard.is_hung(self.handle):
+            guard.defer(self.handle, retry=self.disable_decoration)
+            return False
         try:
-            style = win32gui.GetWindowLong(self.handle, GWL_STYLE)
-            style -= WS_CAPTION
-            win32gui.SetWindowLong(self.handle, GWL_STYLE, style)
+            style = backend.get().get_window_long(self.handle, GWL_STYLE)
+            style &= ~WS_CAPTION
+            guard.call([self.handle], backend.get().set_window_long,
+                       self.handle, GWL_STYLE, style)
+            window_cache.forget(self.handle, ('style',))
             self.is_decorated = False
             self.update()
             return True
-        except win32gui.error:
-            print('error removing decoration')
+        except WindowTimeout:
+            guard.defer(self.handle, retry=self.disable_decoration)
+            return False
+        except BackendError:
+            log.warning('error removing decoration from %s', self.handle)
             return False
 
     def is_floating(self):
@@ -205,23 +222,27 @@ class Window(object):
     def set_floating(self, value):
         if self.floating == value:
             return True
+        insert_after = HWND_TOPMOST if value else HWND_NOTOPMOST
         try:
-            left, top, right, bottom = self.display_size
-            win32gui.SetWindowPos(
-                self.handle,
-                HWND_TOPMOST if value else HWND_NOTOPMOST,
-                left,
-                top,
-                right - left,
-                bottom - top,
-                0
-            )
+            if guard.is_hung(self.handle):
+                guard.post(self.handle, insert_after, self.display_size, 0)
+            else:
+                guard.call([self.handle], backend.get().set_window_pos,
+                           self.handle, insert_after, self.display_size, 0)
+            window_cache.forget(self.handle, ('exstyle',))
             self.floating = value
             return True
-        except win32gui.error:
-            print('error (no)topmosting window')
+        except WindowTimeout:
+            guard.defer(self.handle, retry=lambda: self.__retry_floating(value))
+        except BackendError:
+            log.warning('error (no)topmosting window %s', self.handle)
         return False
 
+    def __retry_floating(self, value):
+        # the caller tiled only if set_floating() worked the first time
+        if self.set_floating(value) and self.tiler is not None:
+            self.tiler.tile_windows()
+
     @property
     def display_area(self):
         left, top, right, bottom = self.display_size
@@ -230,35 +251,56 @@ class Window(object):
     @property
     def display_size(self):
         try:
-            return win32gui.GetWindowRect(self.handle)
-        except win32gui.error:
+            return window_cache.get(self.handle, 'rect', lambda: backend.get().get_window_rect(self.handle))
+        except BackendError:
             return None
 
     @property
     def title(self):
         try:
-            title = win32gui.GetWindowText(self.handle).encode(
-                'cp850', errors='replace').decode('cp850')
-            return title
-        except win32gui.error:
+            return window_cache.get(self.handle, 'title', lambda: backend.get().get_window_text(self.handle))
+        except BackendError:
             return None
 
+    @property
+    def display_title(self):
+        """The title as the console can show it, only for displaying"""
+        title = self.title
+        if title is None:
+            return None
+        return title.encode('cp850', errors='replace').decode('cp850')
+
     @property
     def classname(self):
         try:
-            return win32gui.GetClassName(self.handle)
-        except win32gui.error:
+            return window_cache.get(self.handle, 'classname', lambda: backend.get().get_class_name(self.handle))
+        except BackendError:
             return None
 
-    @staticmethod
-    def get_windows_from_monitor(monitor):
-        def callback(wHandle, results):
-            window = Window(wHandle)
-            if window.should_manage(monitor.display_size) and monitor.contains_window(window):
-                results.append(window)
-                return True
+    @property
+    def style(self):
+        return window_cache.get(self.handle, 'style', lambda: backend.get().get_window_long(self.handle, GWL_STYLE))
+
+    @property
+    def exstyle(self):
+        return window_cache.get(self.handle, 'exstyle', lambda: backend.get().get_window_long(self.handle, GWL_EXSTYLE))
+
+    @property
+    def visible(self):
+        return window_cache.get(self.handle, 'visible', lambda: backend.get().is_window_visible(self.handle))
 
-        windows = []
-        win32gui.EnumWindows(callback, windows)
+    @property
+    def iconic(self):
+        return window_cache.get(self.handle, 'iconic', lambda: backend.get().is_iconic(self.handle))
+
+    @staticmethod
+    def get_windows_from_monitor(monitor, snapshot=None):
+        """Returns tileable windows on the monitor
 
-        return windows
+        Pass a DesktopSnapshot when querying several monitors so the desktop
+        is only enumerated once.
+        """
+        if snapshot is None:
+            from wmpy.snapshot import DesktopSnapshot
+            snapshot = DesktopSnapshot.capture([monitor])
+        return snapshot.windows_for_monitor(monitor)